@@ -0,0 +1,130 @@
+"""Benchmark cases; each takes a generated fleet and returns a callable that runs the measured code once"""
+
+from datetime import datetime
+from types import SimpleNamespace
+from typing import Callable, Dict
+
+from hubspaceng.account import HubspaceAccount, _link_children
+from hubspaceng.models.devices.base import FunctionIndex, filter_function_def
+from hubspaceng.models.functions.color import ColorValue
+from hubspaceng.models.places import Home, Room
+from hubspaceng.tools.fleet import generate_fleet
+from hubspaceng.tools.survey import _anonymize
+
+ACCOUNT_JSON = {"account": {"accountId": "00000000-0000-0000-0000-0000000000aa"}, "name": "Benchmark"}
+
+# Lookups made while building each kind of device, as the device constructors make them
+LOOKUPS = (
+    ("power", "category", None),
+    ("brightness", "numeric", None),
+    ("color-temperature", "category", None),
+    ("color-rgb", "object", None),
+    ("fan-speed", "category", None),
+    ("toggle", "category", ["comfort-breeze"]),
+    ("lock-control", "category", None),
+)
+
+
+def fleet(devices: int) -> list:
+    """Return the fleet benchmarks run against; rooms scale with the device count"""
+    return generate_fleet(devices=devices, rooms=max(1, devices // 20), seed=devices)
+
+
+def _account() -> HubspaceAccount:
+    # Parsing never touches the API, so a stand-in is enough
+    return HubspaceAccount(SimpleNamespace(), ACCOUNT_JSON)
+
+
+def _devices(doc: list) -> list:
+    return [metadevice for metadevice in doc if metadevice["typeId"] == "metadevice.device"]
+
+
+def parse_metadevices(doc: list) -> Callable[[], None]:
+    """Build every object for an account from scratch"""
+    def run():
+        _account()._parse_metadevices(doc)  # pylint: disable=protected-access
+    return run
+
+
+def reparse_metadevices(doc: list) -> Callable[[], None]:
+    """Reconcile an unchanged metadevices document against an already populated account"""
+    account = _account()
+    account._parse_metadevices(doc)  # pylint: disable=protected-access
+
+    def run():
+        account._parse_metadevices(doc)  # pylint: disable=protected-access
+    return run
+
+
+def filter_function_defs(doc: list) -> Callable[[], None]:
+    """Look up every constructor function on every device with the module-level filter_function_def"""
+    devices = _devices(doc)
+
+    def run():
+        for metadevice in devices:
+            for class_filter, type_filter, instance_filter in LOOKUPS:
+                filter_function_def(metadevice, class_filter, type_filter, instance_filter=instance_filter)
+    return run
+
+
+def construct_devices(doc: list) -> Callable[[], None]:
+    """Detect the type of, index and construct every device"""
+    account = _account()
+    devices = _devices(doc)
+    state_update = datetime.utcnow()
+
+    def run():
+        for metadevice in devices:
+            function_index = FunctionIndex.from_device_json(metadevice)
+            device_type = account._detect_device_type(metadevice, function_index)  # pylint: disable=protected-access
+            if device_type is not None:
+                device_type(metadevice, account, state_update, function_index)
+    return run
+
+
+def link_hierarchy(doc: list) -> Callable[[], None]:
+    """Link fresh homes and rooms to already built rooms and devices"""
+    account = _account()
+    account._parse_metadevices(doc)  # pylint: disable=protected-access
+    homes = [metadevice for metadevice in doc if metadevice["typeId"] == "metadevice.home"]
+    rooms = [metadevice for metadevice in doc if metadevice["typeId"] == "metadevice.room"]
+    state_update = datetime.utcnow()
+
+    def run():
+        for room_json in rooms:
+            room = Room(room_json, account, state_update)
+            _link_children(
+                room.id, room.child_ids, room.devices, (account.devices,), room.add_device, room.remove_device
+            )
+        for home_json in homes:
+            home = Home(home_json, account, state_update)
+            _link_children(home.id, home.child_ids, home.rooms, (account.rooms,), home.add_room, home.remove_room)
+    return run
+
+
+def color_values(doc: list) -> Callable[[], None]:
+    """Construct one ColorValue per device"""
+    colors = [(index % 256, (index * 7) % 256, (index * 13) % 256) for index in range(len(_devices(doc)))]
+
+    def run():
+        for red, green, blue in colors:
+            ColorValue(red, green, blue)
+    return run
+
+
+def anonymize(doc: list) -> Callable[[], None]:
+    """Anonymize a metadevices document as tools/survey.py does"""
+    def run():
+        _anonymize(doc)
+    return run
+
+
+CASES = {
+    "parse_metadevices": parse_metadevices,
+    "reparse_metadevices": reparse_metadevices,
+    "filter_function_def": filter_function_defs,
+    "construct_devices": construct_devices,
+    "link_hierarchy": link_hierarchy,
+    "color_value": color_values,
+    "anonymize": anonymize,
+}  # type: Dict[str, Callable[[list], Callable[[], None]]]
@@ -0,0 +1,125 @@
+"""Run the microbenchmarks, optionally saving or comparing against a baseline
+
+    $ PYTHONPATH=src python benchmarks/run.py
+    $ PYTHONPATH=src python benchmarks/run.py --save benchmarks/baselines/baseline.json
+    $ PYTHONPATH=src python benchmarks/run.py --compare benchmarks/baselines/baseline.json
+
+Timings only mean something on the machine that recorded them, so baselines are not committed;
+save one locally before a change and compare against it after. Comparing exits with status 1
+if any case is slower than the baseline by more than --threshold, unless the baseline was
+recorded on another host, in which case the comparison is only reported.
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from cases import CASES, fleet  # noqa: E402  pylint: disable=wrong-import-position
+
+DEFAULT_SIZES = (10, 1000, 10000)
+
+
+def _time(run, repeat: int, min_time: float) -> list:
+    """Return the per-call time of each of `repeat` rounds, each looping for at least min_time"""
+    run()  # warm up
+    loops = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(loops):
+            run()
+        elapsed = time.perf_counter() - started
+        if elapsed >= min_time or loops >= 1 << 20:
+            break
+        loops *= 2
+    timings = [elapsed / loops]
+    for _ in range(repeat - 1):
+        started = time.perf_counter()
+        for _ in range(loops):
+            run()
+        timings.append((time.perf_counter() - started) / loops)
+    return timings
+
+
+def run_benchmarks(sizes, cases, repeat: int, min_time: float) -> dict:
+    """Run every case at every size and return the results keyed by case/size"""
+    results = {}
+    for size in sizes:
+        doc = fleet(size)
+        for name in cases:
+            timings = _time(CASES[name](doc), repeat, min_time)
+            key = f"{name}/{size}"
+            results[key] = {"min": min(timings), "median": statistics.median(timings)}
+            print(f"{key:<32} min {min(timings) * 1000:12.4f} ms   median {statistics.median(timings) * 1000:12.4f} ms")
+    return results
+
+
+def host_fingerprint() -> dict:
+    """Return what identifies the machine and interpreter timings were taken on"""
+    return {
+        "node": platform.node(),
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "cpus": os.cpu_count(),
+        "implementation": platform.python_implementation(),
+        "python": platform.python_version(),
+    }
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> bool:
+    """Print each case against the baseline; returns False if any regressed past the threshold"""
+    passed = True
+    print()
+    same_host = baseline.get("host") == host_fingerprint()
+    if not same_host:
+        print("Baseline was recorded on another host; ratios are for information only")
+    for key, result in results.items():
+        base = baseline.get("results", {}).get(key)
+        if base is None:
+            print(f"{key:<32} no baseline")
+            continue
+        ratio = result["min"] / base["min"] if base["min"] else float("inf")
+        verdict = "ok"
+        if ratio > threshold:
+            verdict = "REGRESSION" if same_host else "slower"
+            passed = passed and not same_host
+        elif ratio < 1 / threshold:
+            verdict = "faster"
+        print(f"{key:<32} {ratio:6.2f}x baseline   {verdict}")
+    return passed
+
+
+def main() -> int:
+    """Run the benchmarks selected on the command line"""
+    parser = argparse.ArgumentParser(description="Run hubspace-ng microbenchmarks.")
+    parser.add_argument("-s", "--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES), help="fleet sizes, in devices")
+    parser.add_argument("-c", "--cases", nargs="+", choices=sorted(CASES), default=list(CASES), help="cases to run")
+    parser.add_argument("-r", "--repeat", type=int, default=5, help="timed rounds per case")
+    parser.add_argument("--min-time", type=float, default=0.2, help="minimum seconds per round")
+    parser.add_argument("--save", metavar="FILE", help="save the results as a baseline")
+    parser.add_argument("--compare", metavar="FILE", help="compare the results against a baseline")
+    parser.add_argument("--threshold", type=float, default=1.25, help="slowdown ratio counted as a regression")
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.sizes, args.cases, args.repeat, args.min_time)
+
+    if args.save:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save)), exist_ok=True)
+        with open(args.save, "w", encoding="utf-8") as baseline_file:
+            json.dump({"host": host_fingerprint(), "results": results}, baseline_file, indent=2)
+            baseline_file.write("\n")
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as baseline_file:
+            baseline = json.load(baseline_file)
+        if not compare(results, baseline, args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
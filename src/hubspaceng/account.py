@@ -1,14 +1,12 @@
 """Object describing an Account that the logged in user can access."""
 
 import asyncio
-from datetime import datetime, timedelta
+from datetime import datetime
 import logging
-from typing import TYPE_CHECKING, Dict, Optional
+from typing import TYPE_CHECKING, Callable, Dict, Optional
 
-from hubspaceng.const import (
-    METADATA_API_CALLING_HOST,
-    METADATA_API_HOST
-)
+from hubspaceng.const import DEFAULT_ACCOUNT_UPDATE_INTERVAL
+from hubspaceng.changes import ChangeSet, MembershipChange, StateChange
 from hubspaceng.models.devices import (
     BaseDevice,
     ComboDevice,
@@ -16,23 +14,52 @@ from hubspaceng.models.devices import (
     LockDevice,
     PlugDevice
 )
-from hubspaceng.models.devices.base import filter_function_def
+from hubspaceng.models.devices.base import FunctionIndex
 from hubspaceng.models.devices.lights import (
     BaseLightDevice,
     TunableLightDevice,
     RGBLightDevice
 )
+from hubspaceng.models.group import GroupCommandsMixin
 from hubspaceng.models.places import Home, Room
+from hubspaceng.deadline import with_deadline
 from hubspaceng.errors import HubspaceError
+from hubspaceng.scheduler import Priority
 
 if TYPE_CHECKING:
     from hubspaceng.aio.api import API
 
 _LOGGER = logging.getLogger(__name__)
 
-DEFAULT_STATE_UPDATE_INTERVAL = timedelta(seconds=5)
+def _link_children(
+    parent_id: str, child_ids: list, linked: dict, sources: tuple, link: Callable, unlink: Callable
+) -> list[MembershipChange]:
+    """Bring a parent's linked children in line with the child ids in its JSON, touching only what changed
+
+    Returns the children that joined or left the parent; replacing a child object with a new
+    one for the same id is not a membership change.
+    """
+    previous_ids = set(linked)
+    wanted = {}
+    for child_id in child_ids:
+        for source in sources:
+            if child_id in source:
+                wanted[child_id] = source[child_id]
+                break
+
+    # Unlink children that were removed or replaced by a new object
+    for child_id in [i for i, child in linked.items() if wanted.get(i) is not child]:
+        unlink(child_id)
 
-class HubspaceAccount:
+    for child_id, child in wanted.items():
+        if linked.get(child_id) is not child:
+            link(child)
+
+    changes = [MembershipChange(parent_id, i, True) for i in wanted if i not in previous_ids]
+    changes.extend(MembershipChange(parent_id, i, False) for i in previous_ids if i not in wanted)
+    return changes
+
+class HubspaceAccount(GroupCommandsMixin):
     """Object describing an Account that the logged in user can access."""
 
     def __init__(self, api: "API", account_json: dict, devices: Optional[dict] = None) -> None:
@@ -80,108 +107,184 @@ class HubspaceAccount:
         """Return all rooms within account"""
         return self._rooms
 
-    async def _get_metadevices(self) -> None:
+    def _group_members(self):
+        return self._devices.values()
+
+    async def _get_metadevices(self, priority: Priority = Priority.NORMAL) -> None:
         _LOGGER.debug("Retrieving devices for account %s", self.name or self.id)
 
         _, metadevices_resp = await self._api.request(
             method="get",
+            priority=priority,
             returns="json",
-            url=f"https://{METADATA_API_HOST}/v1/accounts/{self.id}/metadevices?expansions=state",
+            url=f"{self._api.endpoints.metadevices_url(self.id)}?expansions=state",
             headers = {
                 "Content-Type": "application/json",
                 "Accept": "application/json",
                 "accept-encoding": "gzip",
-                "host": METADATA_API_CALLING_HOST
+                "host": self._api.endpoints.metadata_calling_host
             }
         )
 
         return metadevices_resp
 
-    def _parse_metadevices(self, metadevices_resp: dict) -> None:
+    @staticmethod
+    def _detect_device_type(metadevice: dict, function_index: FunctionIndex) -> Optional[type]:
+        """Determine which device class should represent a metadevice"""
+        if len(metadevice['children']) > 0:
+            return ComboDevice
+        device_class = metadevice['description']['device']['deviceClass']
+        if device_class == "fan":
+            return FanDevice
+        if device_class == "light":
+            if function_index.find("color-temperature", "category") is not None:
+                return TunableLightDevice
+            if function_index.find("color-rgb", "object") is not None:
+                return RGBLightDevice
+            return BaseLightDevice
+        if device_class == "power-outlet":
+            return PlugDevice
+        if device_class == "door-lock":
+            return LockDevice
+        # TODO: Support other device types
+        return None
+
+    def _reconcile_device(self, metadevice: dict, state_update: datetime, changes: ChangeSet) -> Optional[BaseDevice]:
+        """Update an existing device in place, or build a new one if it is new or its shape changed"""
+        device_id = metadevice['id']
+        existing = self._devices.get(device_id) or self._combodevices.get(device_id)
+        if existing is not None and existing.is_compatible(metadevice):
+            existing.update_json(metadevice, state_update)
+            # Hydrate function state from the embedded state expansion
+            changes.states.extend(existing.hydrate(metadevice.get('state'), state_update))
+            return existing
+
+        function_index = FunctionIndex.from_device_json(metadevice)
+        device_type = self._detect_device_type(metadevice, function_index)
+        if device_type is None:
+            _LOGGER.debug("Skipping unsupported device %s (%s)", device_id, metadevice['description']['device']['deviceClass'])
+            return None
+        device = device_type(metadevice, self, state_update, function_index)
+        device.hydrate(metadevice.get('state'), state_update)
+
+        if existing is None:
+            changes.added.append(device_id)
+        else:
+            # The device was rebuilt; report state changes against the object it replaces
+            old_values = existing.state_values()
+            for function in device.functions:
+                old_value = old_values.get(function.state_key)
+                if function.get_state() != old_value:
+                    changes.states.append(StateChange(
+                        device_id, function.func_class, function.func_instance,
+                        old_value, function.get_state(), state_update
+                    ))
+        return device
+
+    def _reconcile_place(self, places: dict, place_type: type, metadevice: dict, state_update: datetime, changes: ChangeSet) -> None:
+        """Update an existing place in place, or build a new one"""
+        place = places.get(metadevice['id'])
+        if place is not None:
+            place.update_json(metadevice, state_update)
+        else:
+            places[metadevice['id']] = place_type(metadevice, self, state_update)
+            changes.added.append(metadevice['id'])
+
+    def _parse_metadevices(self, metadevices_resp: dict) -> ChangeSet:
         _LOGGER.debug("Parsing devices for account %s", self.name or self.id)
+        changes = ChangeSet()
 
         # Ensure we have a valid list of devices
         if metadevices_resp is not None and not isinstance(metadevices_resp, list):
             raise HubspaceError(
                 f"Received metadevices of type {type(metadevices_resp)} but expecting type list"
             )
+        if metadevices_resp is None:
+            _LOGGER.debug("No devices found for account %s", self.name or self.id)
+            return changes
+        if len(metadevices_resp) == 0:
+            _LOGGER.debug("No devices found for account %s", self.name or self.id)
 
-        # Parse the response into appropriate objects
+        # Reconcile the response against the objects we already have, keyed by id
         state_update_timestmp = datetime.utcnow()
-        if metadevices_resp is not None and len(metadevices_resp) > 0:
-            for metadevice in metadevices_resp:
-                device_id = metadevice['id']
-                type_id = metadevice['typeId']
-                if type_id == 'metadevice.home':
-                    home = Home(metadevice, self, state_update_timestmp)
-                    self._homes[device_id] = home
-                elif type_id == 'metadevice.room':
-                    room = Room(metadevice, self, state_update_timestmp)
-                    self._rooms[device_id] = room
-                elif type_id == 'metadevice.device':
-                    if len(metadevice['children']) > 0:
-                        combo = ComboDevice(metadevice, self, state_update_timestmp)
-                        self._combodevices[device_id] = combo
-                    else:
-                        device_class = metadevice['description']['device']['deviceClass']
-                        if device_class == "fan":
-                            device = FanDevice(metadevice, self, state_update_timestmp)
-                        elif device_class == "light":
-                            if filter_function_def(metadevice, "color-temperature", "category") is not None:
-                                device = TunableLightDevice(metadevice, self, state_update_timestmp)
-                            elif filter_function_def(metadevice, "color-rgb", "object") is not None:
-                                device = RGBLightDevice(metadevice, self, state_update_timestmp)
-                            else:
-                                device = BaseLightDevice(metadevice, self, state_update_timestmp)
-                        elif device_class == "power-outlet":
-                            device = PlugDevice(metadevice, self, state_update_timestmp)
-                        elif device_class == "door-lock":
-                            device = LockDevice(metadevice, self, state_update_timestmp)
-                        # TODO: Support other device types
-
-                        self._devices[device_id] = device
-
-            # Link devices to combodevices
-            for combodevice in self._combodevices.values():
-                missing_children = combodevice.get_unlinked_children()
-                for missing_child in missing_children:
-                    if missing_child in self._devices:
-                        combodevice.add_child(self._devices[missing_child])
-
-            # Link rooms to homes
-            for home in self._homes.values():
-                missing_children = home.get_unlinked_children()
-                for missing_child in missing_children:
-                    if missing_child in self._rooms:
-                        home.add_room(self._rooms[missing_child])
-
-            # Link devices/combodevices to rooms
-            for room in self._rooms.values():
-                missing_children = room.get_unlinked_children()
-                for missing_child in missing_children:
-                    if missing_child in self._combodevices:
-                        room.add_device(self._combodevices[missing_child])
-                    elif missing_child in self._devices:
-                        room.add_device(self._devices[missing_child])
+        seen_ids = set()
+        for metadevice in metadevices_resp:
+            device_id = metadevice['id']
+            type_id = metadevice['typeId']
+            if type_id == 'metadevice.home':
+                self._reconcile_place(self._homes, Home, metadevice, state_update_timestmp, changes)
+            elif type_id == 'metadevice.room':
+                self._reconcile_place(self._rooms, Room, metadevice, state_update_timestmp, changes)
+            elif type_id == 'metadevice.device':
+                device = self._reconcile_device(metadevice, state_update_timestmp, changes)
+                if device is None:
+                    continue
+                if isinstance(device, ComboDevice):
+                    self._devices.pop(device_id, None)
+                    self._combodevices[device_id] = device
+                else:
+                    self._combodevices.pop(device_id, None)
+                    self._devices[device_id] = device
+            else:
+                continue
+            seen_ids.add(device_id)
 
-        else:
-            _LOGGER.debug("No devices found for account %s", self.name or self.id)
+        # Drop anything that is no longer in the response
+        for objects in (self._homes, self._rooms, self._combodevices, self._devices):
+            for removed_id in [i for i in objects if i not in seen_ids]:
+                _LOGGER.debug("Removing %s from account %s", removed_id, self.name or self.id)
+                del objects[removed_id]
+                changes.removed.append(removed_id)
+
+        # Link devices to combodevices
+        for combodevice in self._combodevices.values():
+            changes.memberships.extend(_link_children(
+                combodevice.id, combodevice.device_json['children'], combodevice.children, (self._devices,),
+                combodevice.add_child, combodevice.remove_child
+            ))
+
+        # Link rooms to homes
+        for home in self._homes.values():
+            changes.memberships.extend(_link_children(
+                home.id, home.child_ids, home.rooms, (self._rooms,),
+                home.add_room, home.remove_room
+            ))
+
+        # Link devices/combodevices to rooms
+        for room in self._rooms.values():
+            changes.memberships.extend(_link_children(
+                room.id, room.child_ids, room.devices, (self._combodevices, self._devices),
+                room.add_device, room.remove_device
+            ))
+
+        return changes
 
     async def get_metadevices_doc(self) -> dict:
         """Get the a fresh metadevices doc for debug purposes"""
         return await self._get_metadevices()
 
-    async def update(self) -> None:
-        """Get up-to-date device list."""
+    async def update(self, timeout: Optional[float] = None) -> ChangeSet:
+        """Get up-to-date device list and state, returning what changed since the last update.
+
+        Must finish within timeout seconds, defaulting to `API.timeouts.update`, or
+        DeadlineExceededError is raised.
+        """
+        return await with_deadline(
+            self._update_devices(),
+            self._api.timeouts.update if timeout is None else timeout,
+            f"Updating account {self.name or self.id}",
+        )
+
+    async def _update_devices(self) -> ChangeSet:
         # The Hubspace API can time out if state updates are too frequent; therefore,
         # if back-to-back requests occur within a threshold, respond to only the first
         # Ensure only 1 update task can run at a time.
         async with self._update:
             call_dt = datetime.utcnow()
             if not self.last_device_list_update:
-                self.last_device_list_update = call_dt - DEFAULT_STATE_UPDATE_INTERVAL
+                self.last_device_list_update = call_dt - DEFAULT_ACCOUNT_UPDATE_INTERVAL
             next_available_call_dt = (
-                self.last_device_list_update + DEFAULT_STATE_UPDATE_INTERVAL
+                self.last_device_list_update + DEFAULT_ACCOUNT_UPDATE_INTERVAL
             )
 
             # Ensure we're within our minimum update interval
@@ -190,11 +293,12 @@ class HubspaceAccount:
                     "Ignoring device update request for account %s as it is within throttle window",
                     self.name or self.id,
                 )
-                return
+                return ChangeSet(throttled=True)
 
-            metadevices_doc = await self._get_metadevices()
-            self._parse_metadevices(metadevices_doc)
-            for device in self._devices.values():
-                for function in device.functions:
-                    await function.update()
+            # The metadevices doc embeds every device's state, so there is no need for
+            # a per-function state request here; use BaseFunction.update() on demand instead.
+            metadevices_doc = await self._get_metadevices(priority=Priority.BACKGROUND)
+            changes = self._parse_metadevices(metadevices_doc)
             self.last_device_list_update = datetime.utcnow()
+        await self._api.events.publish(changes.states)
+        return changes
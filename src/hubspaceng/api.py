@@ -3,6 +3,7 @@
 import asyncio
 import logging
 import re
+import time
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional, Tuple, Union
 
@@ -12,7 +13,18 @@ from pkce import generate_code_verifier, get_code_challenge
 from yarl import URL
 
 from hubspaceng.account import HubspaceAccount
-from hubspaceng.request import REQUEST_METHODS, HubspaceRequest
+from hubspaceng.changes import AccountUpdateResult
+from hubspaceng.connection import ConnectionManager
+from hubspaceng.deadline import Timeouts, clear_deadline, with_deadline
+from hubspaceng.endpoints import DEFAULT_ENDPOINTS, Endpoints
+from hubspaceng.events import EventBus, OverflowPolicy, Subscription
+from hubspaceng.metrics import MetricsRegistry
+from hubspaceng.polling import AdaptivePoller
+from hubspaceng.request import REQUEST_METHODS, HubspaceRequest, Transport
+from hubspaceng.retry import RetryPolicy
+from hubspaceng.scheduler import Priority, RequestScheduler
+from hubspaceng.snapshot import load_snapshot, save_snapshot
+from hubspaceng.tokens import StoredToken, TokenStore
 from hubspaceng.models.devices.base import BaseDevice
 from hubspaceng.models.places import Home, Room
 from hubspaceng.errors import (
@@ -22,15 +34,20 @@ from hubspaceng.errors import (
     RequestError
 )
 from hubspaceng.const import (
-    BASE_API_ENDPOINT,
     DEFAULT_TOKEN_REFRESH,
     DEFAULT_STATE_UPDATE_INTERVAL,
-    HUBSPACE_OAUTH_REALM
+    DEFAULT_SUBSCRIPTION_QUEUE_SIZE,
+    STORED_TOKEN_MIN_LIFETIME
 )
 
 _LOGGER = logging.getLogger(__name__)
 _LOGGER.setLevel("DEBUG")
 
+def _is_rejected(err: RequestError) -> bool:
+    """Return whether a request failed because the server refused it, rather than a connection problem"""
+    cause = err.__cause__
+    return isinstance(cause, ClientResponseError) and cause.status in (400, 401, 403)
+
 class API:  # pylint: disable=too-many-instance-attributes
     """Define a class for interacting with the HubSpace App API."""
 
@@ -39,14 +56,43 @@ class API:  # pylint: disable=too-many-instance-attributes
         username: str,
         password: str,
         websession: ClientSession = None,
+        scheduler: RequestScheduler = None,
+        optimistic_updates: bool = False,
+        token_store: TokenStore = None,
+        connections: ConnectionManager = None,
+        metrics: MetricsRegistry = None,
+        transport: Transport = None,
+        endpoints: Endpoints = None,
+        retry_policy: RetryPolicy = None,
+        timeouts: Timeouts = None,
     ) -> None:
-        """Initialize."""
+        """Initialize.
+
+        Pass connections to tune the connection pool; otherwise one is created, or the
+        connector of websession is shared if given. Pass a transport, such as
+        hubspaceng.recording.TrafficRecorder or ReplayTransport, to record or replay traffic.
+        Pass endpoints to send requests somewhere other than the production hosts,
+        retry_policy to change how failed requests are retried, and timeouts to change the
+        default deadline of each kind of operation.
+        """
         self.__credentials = {"username": username, "password": password}
-        self._hsrequests = HubspaceRequest(websession or ClientSession())
+        self.endpoints = endpoints or DEFAULT_ENDPOINTS  # type: Endpoints
+        self.timeouts = timeouts or Timeouts()  # type: Timeouts
+        self._connections = connections or ConnectionManager(websession)
+        self.metrics = metrics or MetricsRegistry()  # type: MetricsRegistry
+        self._hsrequests = HubspaceRequest(
+            connections=self._connections, metrics=self.metrics, transport=transport,
+            retry_policy=retry_policy,
+        )
         self._authentication_task = None  # type:Optional[asyncio.Task]
+        self._renewal_task = None  # type:Optional[asyncio.Task]
+        self._oauth_refresh_token = None  # type: Optional[str]
+        # Tokens are loaded from the store on first authentication and saved on every renewal
+        self._token_store = token_store  # type: Optional[TokenStore]
+        self._token_store_loaded = False  # type: bool
         self._codeverifier = None  # type: Optional[str]
         self._invalid_credentials = False  # type: bool
-        self._lock = asyncio.Lock()  # type: asyncio.Lock
+        self._scheduler = scheduler or RequestScheduler()  # type: RequestScheduler
         self._update = asyncio.Lock()  # type: asyncio.Lock
         self._security_token = (
             None,
@@ -56,6 +102,21 @@ class API:  # pylint: disable=too-many-instance-attributes
 
         self._accounts = {}  # type: Dict[str, HubspaceAccount]
         self.last_state_update = None  # type: Optional[datetime]
+        # Default for BaseFunction.set_state: update local state before the server confirms it
+        self.optimistic_updates = optimistic_updates  # type: bool
+        self._poller = None  # type: Optional[AdaptivePoller]
+        self._refresh_task = None  # type: Optional[asyncio.Task]
+        self.events = EventBus(self)  # type: EventBus
+
+    @property
+    def scheduler(self) -> RequestScheduler:
+        """Return the scheduler that limits concurrent requests"""
+        return self._scheduler
+
+    @property
+    def queue_metrics(self) -> Dict[str, dict]:
+        """Return queue depth and queue wait statistics per request priority lane"""
+        return self._scheduler.queue_metrics()
 
     @property
     def accounts(self) -> List[HubspaceAccount]:
@@ -101,6 +162,8 @@ class API:  # pylint: disable=too-many-instance-attributes
             username (str): Username to authenticate with
         """
         self._invalid_credentials = False
+        self._token_store_loaded = False
+        self._oauth_refresh_token = None
         self.__credentials["username"] = username
 
     @property
@@ -163,8 +226,39 @@ class API:  # pylint: disable=too-many-instance-attributes
         json: dict = None,
         allow_redirects: bool = True,
         login_request: bool = False,
+        priority: Priority = Priority.NORMAL,
+        timeout: Optional[float] = None,
+    ) -> Tuple[Optional[ClientResponse], Optional[Union[dict, str]]]:
+        """Make a request.
+
+        The wait for a scheduler slot, any token refresh and every retry share one deadline:
+        timeout seconds (defaulting to timeouts.request), or sooner if the calling operation
+        has a deadline. When it passes, the request is cancelled and DeadlineExceededError
+        is raised.
+        """
+        return await with_deadline(
+            self._request(
+                method, returns, url, websession, headers, params, data, json,
+                allow_redirects, login_request, priority
+            ),
+            self.timeouts.request if timeout is None else timeout,
+            f"{method.upper()} request to {url}",
+        )
+
+    async def _request(
+        self,
+        method: str,
+        returns: str,
+        url: Union[URL, str],
+        websession: ClientSession,
+        headers: Optional[dict],
+        params: Optional[dict],
+        data: Optional[dict],
+        json: Optional[dict],
+        allow_redirects: bool,
+        login_request: bool,
+        priority: Priority,
     ) -> Tuple[Optional[ClientResponse], Optional[Union[dict, str]]]:
-        """Make a request."""
 
         # Determine the method to call based on what is to be returned.
         call_method = REQUEST_METHODS.get(returns)
@@ -198,11 +292,12 @@ class API:  # pylint: disable=too-many-instance-attributes
                 _LOGGER.debug(message)
                 raise RequestError(message) from err
 
-        # The Hubspace API can time out if multiple concurrent requests are made, so
-        # ensure that only one gets through at a time.
-        # Exception is when this is a login request AND there is already a lock, in that case
-        # we're sending the request anyways as we know there is no active request now.
-        async with self._lock:
+        # The Hubspace API can time out if too many concurrent requests are made, so
+        # requests wait for a slot within the scheduler's concurrency and rate limits.
+        # Login requests bypass the scheduler as they are awaited by requests holding a slot.
+        enqueued = time.monotonic()
+        async with self._scheduler.slot(URL(url).host, priority):
+            self.metrics.observe_queue_wait(priority.name.lower(), time.monotonic() - enqueued)
 
             # Check if an authentication task was running and if so, if it has completed.
             await self._authentication_task_completed()
@@ -278,7 +373,8 @@ class API:  # pylint: disable=too-many-instance-attributes
 
         if wait:
             try:
-                await self._authentication_task
+                # Shielded so a caller giving up does not cancel authentication for everyone else
+                await asyncio.shield(self._authentication_task)
             except (RequestError, AuthenticationError) as auth_err:
                 # Raise authentication error, we need a new token to continue
                 # and not getting it right now.
@@ -289,9 +385,38 @@ class API:  # pylint: disable=too-many-instance-attributes
         return self._authentication_task
 
     async def _authenticate(self) -> None:
-        # Retrieve and store the initial security token:
-        _LOGGER.debug("Initiating OAuth authentication")
-        token, expires = await self._oauth_authenticate()
+        # Shared by every caller waiting for a token, so bounded by its own timeout rather
+        # than the deadline of whichever request happened to start it
+        clear_deadline()
+        await with_deadline(self._obtain_token(), self.timeouts.auth, "Authentication")
+
+    async def _obtain_token(self) -> None:
+        if self._token_store is not None and not self._token_store_loaded:
+            self._token_store_loaded = True
+            started = time.monotonic()
+            if await self._load_stored_token():
+                self.metrics.observe_auth("stored", time.monotonic() - started)
+                return
+
+        token = expires = refresh_token = None
+        if self._oauth_refresh_token is not None:
+            # Renew with the refresh token, falling back to a full login only if it is rejected
+            started = time.monotonic()
+            try:
+                token, expires, refresh_token = await self._oauth_refresh(self._oauth_refresh_token)
+                self.metrics.observe_auth("refresh", time.monotonic() - started)
+            except RequestError as err:
+                if not _is_rejected(err):
+                    raise
+                _LOGGER.debug("Refresh token was rejected, logging in again: %s", err)
+                self._oauth_refresh_token = None
+
+        if token is None:
+            # Retrieve and store the initial security token:
+            _LOGGER.debug("Initiating OAuth authentication")
+            started = time.monotonic()
+            token, expires, refresh_token = await self._oauth_authenticate()
+            self.metrics.observe_auth("login", time.monotonic() - started)
 
         if token is None:
             _LOGGER.debug("No security token received.")
@@ -300,16 +425,112 @@ class API:  # pylint: disable=too-many-instance-attributes
             )
 
         _LOGGER.debug("Received token that will expire in %s seconds", expires)
+        issued_at = datetime.utcnow()
+        stored_token = StoredToken(
+            token, issued_at, issued_at + timedelta(seconds=expires), refresh_token
+        )
+        self._use_token(stored_token)
+        if self._token_store is not None:
+            try:
+                await self._token_store.save(self.username, stored_token)
+            except OSError as err:
+                _LOGGER.warning("Unable to save token: %s", err)
+
+    def _use_token(self, stored_token: StoredToken) -> None:
+        # The stored token keeps the server's expiry; only renewal is held back to at least
+        # DEFAULT_TOKEN_REFRESH after issue
+        refresh_at = max(stored_token.refresh_at, stored_token.issued_at + timedelta(seconds=DEFAULT_TOKEN_REFRESH))
+        if refresh_at > stored_token.refresh_at:
+            _LOGGER.debug(
+                "Token lifetime is less than twice the default refresh of %s seconds, renewing at %s instead.",
+                DEFAULT_TOKEN_REFRESH,
+                refresh_at,
+            )
         self._security_token = (
-            token,
-            datetime.utcnow() + timedelta(seconds=int(expires / 2)),
+            stored_token.access_token,
+            refresh_at,
             datetime.now(),
         )
+        if stored_token.refresh_token is not None:
+            self._oauth_refresh_token = stored_token.refresh_token
+            delay = (refresh_at - datetime.utcnow()).total_seconds()
+            self._schedule_renewal(max(0, int(delay)))
+
+    async def _load_stored_token(self) -> bool:
+        """Use a token from the token store; returns whether the stored access token is usable as is"""
+        try:
+            stored_token = await self._token_store.load(self.username)
+        except OSError as err:
+            _LOGGER.warning("Unable to load stored token: %s", err)
+            return False
+        if stored_token is None:
+            return False
+        if stored_token.is_valid(STORED_TOKEN_MIN_LIFETIME):
+            _LOGGER.debug("Using stored token that expires at %s", stored_token.expires_at)
+            self._use_token(stored_token)
+            return True
+        # The access token is too old to use, but its refresh token may still be good
+        self._oauth_refresh_token = stored_token.refresh_token
+        return False
+
+    def _schedule_renewal(self, delay: int) -> None:
+        """Renew the token in the background before it expires, so requests never wait on it"""
+        if self._renewal_task is not None:
+            self._renewal_task.cancel()
+        self._renewal_task = asyncio.create_task(
+            self._renew_after(delay), name="Hubspace_Token_Renewal"
+        )
+
+    async def _renew_after(self, delay: int) -> None:
+        await asyncio.sleep(delay)
+        _LOGGER.debug("Renewing token ahead of expiry")
+        self._renewal_task = None
+        await self._authentication_task_completed()
+        try:
+            await self.authenticate(wait=False)
+        except InvalidCredentialsError as err:
+            _LOGGER.debug("Unable to renew token: %s", err)
+
+    @property
+    def connections(self) -> ConnectionManager:
+        """Return the connection pool used for authentication and API requests"""
+        return self._connections
+
+    @property
+    def retry_policy(self) -> RetryPolicy:
+        """Return the policy deciding when failed requests are retried"""
+        return self._hsrequests.retry_policy
+
+    async def __aenter__(self) -> "API":
+        return self
 
+    async def __aexit__(self, exc_type, exc, traceback) -> None:
+        await self.close()
 
-    async def _oauth_authenticate(self) -> Tuple[str, int]:
+    async def close(self) -> None:
+        """Stop background work and close the connections this API created
 
-        async with ClientSession() as session:
+        Polling, refreshes, token renewal, any authentication in progress and event delivery
+        to BLOCK subscribers are cancelled.
+        """
+        await self.stop_polling()
+        for task in (self._refresh_task, self._renewal_task, self._authentication_task):
+            if task is not None and not task.done():
+                task.cancel()
+                try:
+                    await task
+                except (asyncio.CancelledError, HubspaceError):
+                    pass
+        self._refresh_task = None
+        self._renewal_task = None
+        self._authentication_task = None
+        await self.events.close()
+        await self._connections.close()
+
+    async def _oauth_authenticate(self) -> Tuple[str, int, Optional[str]]:
+
+        # A fresh cookie jar for each login, over the shared connection pool
+        async with self._connections.auth_session() as session:
 
             # Get Session Code
             # We scrape a session code, tab_id and execution from the form
@@ -318,7 +539,7 @@ class API:  # pylint: disable=too-many-instance-attributes
             resp, session_text = await self.request(
                 method="get",
                 returns="text",
-                url=f"{HUBSPACE_OAUTH_REALM}/protocol/openid-connect/auth",
+                url=f"{self.endpoints.oauth_realm}/protocol/openid-connect/auth",
                 websession=session,
                 headers={
                     "Content-Type": "application/x-www-form-urlencoded",
@@ -346,7 +567,7 @@ class API:  # pylint: disable=too-many-instance-attributes
             resp, _ = await self.request(
                 method="post",
                 returns="text",
-                url=f"{HUBSPACE_OAUTH_REALM}/login-actions/authenticate",
+                url=f"{self.endpoints.oauth_realm}/login-actions/authenticate",
                 websession=session,
                 headers={
                     "Content-Type": "application/x-www-form-urlencoded",
@@ -381,7 +602,7 @@ class API:  # pylint: disable=too-many-instance-attributes
             resp, refresh_json = await self.request(
                 method="post",
                 returns="json",
-                url=f"{HUBSPACE_OAUTH_REALM}/protocol/openid-connect/token",
+                url=f"{self.endpoints.oauth_realm}/protocol/openid-connect/token",
                 websession=session,
                 headers={
                     "Content-Type": "application/x-www-form-urlencoded",
@@ -398,28 +619,58 @@ class API:  # pylint: disable=too-many-instance-attributes
                 allow_redirects=False
             )
 
-            token = f"{refresh_json.get('token_type')} {refresh_json.get('access_token')}"
-            try:
-                expires = int(refresh_json.get("expires_in", DEFAULT_TOKEN_REFRESH))
-            except ValueError:
-                _LOGGER.debug(
-                    "Expires %s received is not an integer, using default.",
-                    refresh_json.get("expires_in"),
-                )
-                expires = DEFAULT_TOKEN_REFRESH * 2
+        return self._parse_token_response(refresh_json)
 
-        if expires < DEFAULT_TOKEN_REFRESH * 2:
+    @staticmethod
+    def _parse_token_response(token_json: dict) -> Tuple[str, int, Optional[str]]:
+        token = f"{token_json.get('token_type')} {token_json.get('access_token')}"
+        try:
+            expires = int(token_json.get("expires_in", DEFAULT_TOKEN_REFRESH))
+        except ValueError:
             _LOGGER.debug(
-                "Expires %s is less then default %s, setting to default instead.",
-                expires,
-                DEFAULT_TOKEN_REFRESH,
+                "Expires %s received is not an integer, using default.",
+                token_json.get("expires_in"),
             )
             expires = DEFAULT_TOKEN_REFRESH * 2
 
-        return token, expires
+        return token, expires, token_json.get("refresh_token")
+
+    async def _oauth_refresh(self, refresh_token: str) -> Tuple[str, int, Optional[str]]:
+        """Renew the access token with the refresh_token grant"""
+        _LOGGER.debug("Refreshing token with refresh_token grant")
+        _, refresh_json = await self.request(
+            method="post",
+            returns="json",
+            url=f"{self.endpoints.oauth_realm}/protocol/openid-connect/token",
+            headers={
+                "Content-Type": "application/x-www-form-urlencoded",
+                "accept-encoding": "gzip",
+            },
+            data={
+                "client_id": 'hubspace_android',
+                "grant_type": "refresh_token",
+                "refresh_token": refresh_token,
+            },
+            login_request=True,
+            allow_redirects=False
+        )
+        return self._parse_token_response(refresh_json)
+
+    async def update_accounts(self, timeout: Optional[float] = None) -> Dict[str, AccountUpdateResult]:
+        """Get up-to-date device info, returning the result of updating each account, by account id.
+
+        Accounts are updated concurrently, within the scheduler's limits. An account that fails
+        is reported in its result without stopping the others; only if every account fails is
+        the first error raised. Must finish within timeout seconds, defaulting to
+        timeouts.update_accounts, or DeadlineExceededError is raised.
+        """
+        return await with_deadline(
+            self._update_accounts(),
+            self.timeouts.update_accounts if timeout is None else timeout,
+            "Account update",
+        )
 
-    async def update_accounts(self) -> None:
-        """Get up-to-date device info."""
+    async def _update_accounts(self) -> Dict[str, AccountUpdateResult]:
         # The Hubspace API can time out if state updates are too frequent; therefore,
         # if back-to-back requests occur within a threshold, respond to only the first
         # Ensure only 1 update task can run at a time.
@@ -435,7 +686,7 @@ class API:  # pylint: disable=too-many-instance-attributes
             # update request is not for a specific device
             if call_dt < next_available_call_dt:
                 _LOGGER.debug("Ignoring update request as it is within throttle window")
-                return
+                return {}
 
             _LOGGER.debug("Updating account information")
             # If update request is for a specific account then do not retrieve account information.
@@ -444,8 +695,9 @@ class API:  # pylint: disable=too-many-instance-attributes
             if len(accounts) == 0:
                 _LOGGER.debug("No accounts found")
                 self._accounts = {}
-                return
+                return {}
 
+            account_ids = []
             for account in accounts:
                 account_id = account.get("account").get("accountId")
                 if account_id is not None:
@@ -468,11 +720,107 @@ class API:  # pylint: disable=too-many-instance-attributes
                         self._accounts.update(
                             {account_id: HubspaceAccount(api=self, account_json=account)}
                         )
+                    account_ids.append(account_id)
 
-                    # Perform a device update for this account.
-                    await self._accounts.get(account_id).update()
-
+            # Perform a device update for every account at once; their requests still queue
+            # for scheduler slots, so this stays within the concurrency and rate limits.
+            outcomes = await asyncio.gather(
+                *(self._accounts[account_id].update() for account_id in account_ids),
+                return_exceptions=True,
+            )
+            results = {}  # type: Dict[str, AccountUpdateResult]
+            for account_id, outcome in zip(account_ids, outcomes):
+                if isinstance(outcome, asyncio.CancelledError):
+                    raise outcome
+                if isinstance(outcome, Exception):
+                    _LOGGER.warning("Unable to update account %s: %s", account_id, outcome)
+                    results[account_id] = AccountUpdateResult(account_id, error=outcome)
+                else:
+                    results[account_id] = AccountUpdateResult(account_id, changes=outcome)
+
+            if results and not any(result.ok for result in results.values()):
+                raise next(iter(results.values())).error
             self.last_state_update = datetime.utcnow()
+            return results
+
+    @property
+    def stale(self) -> bool:
+        """Return whether any device still has state from a snapshot rather than the API server"""
+        return any(device.stale for device in self.devices.values())
+
+    @property
+    def refresh_task(self) -> Optional[asyncio.Task]:
+        """Return the task started by refresh_in_background, if any"""
+        return self._refresh_task
+
+    def refresh_in_background(self, snapshot_path: Optional[str] = None) -> asyncio.Task:
+        """Authenticate and update accounts in a background task, e.g. after restoring a snapshot
+
+        If snapshot_path is given, a fresh snapshot is saved once the update completes. Errors
+        are logged and raised from the returned task.
+        """
+        async def refresh() -> Dict[str, AccountUpdateResult]:
+            try:
+                await self.authenticate(wait=True)
+                results = await self.update_accounts()
+            except HubspaceError as err:
+                _LOGGER.warning("Background refresh failed: %s", err)
+                raise
+            if snapshot_path is not None:
+                await self.save_snapshot(snapshot_path)
+            return results
+
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.create_task(refresh(), name="Hubspace_Refresh")
+        return self._refresh_task
+
+    async def load_snapshot(self, path: str) -> bool:
+        """Restore accounts and devices, marked stale, from a snapshot file; returns whether one was restored"""
+        return await load_snapshot(self, path)
+
+    async def save_snapshot(self, path: str) -> None:
+        """Save accounts, devices and their current state to a snapshot file"""
+        try:
+            await save_snapshot(self, path)
+        except OSError as err:
+            _LOGGER.warning("Unable to save snapshot %s: %s", path, err)
+
+    def subscribe(
+        self,
+        device_ids: Optional[List[str]] = None,
+        device_classes: Optional[List[str]] = None,
+        room_ids: Optional[List[str]] = None,
+        function_classes: Optional[List[str]] = None,
+        maxsize: int = DEFAULT_SUBSCRIPTION_QUEUE_SIZE,
+        policy: OverflowPolicy = OverflowPolicy.DROP_OLDEST,
+    ) -> Subscription:
+        """Subscribe to state changes, filtered by device, device class, room and/or function class
+
+        Usage:
+            async with api.subscribe(room_ids=[room.id]) as changes:
+                async for change in changes:
+                    ...
+        """
+        return self.events.subscribe(
+            device_ids=device_ids,
+            device_classes=device_classes,
+            room_ids=room_ids,
+            function_classes=function_classes,
+            maxsize=maxsize,
+            policy=policy,
+        )
+
+    def start_polling(self, **kwargs) -> AdaptivePoller:
+        """Start polling devices adaptively in the background; keyword arguments configure the AdaptivePoller"""
+        if self._poller is None:
+            self._poller = AdaptivePoller(self, **kwargs)
+        self._poller.start()
+        return self._poller
+
+    async def stop_polling(self) -> None:
+        """Stop background polling"""
+        if self._poller is not None:
+            await self._poller.stop()
 
     async def _authentication_task_completed(self) -> None:
         # If we had something for an authentication task and
@@ -499,7 +847,8 @@ class API:  # pylint: disable=too-many-instance-attributes
 
         # Retrieve the accounts
         _, accounts_resp = await self.request(
-            method="get", returns="json", url=f"{BASE_API_ENDPOINT}/users/me"
+            method="get", returns="json", url=f"{self.endpoints.api_base}/users/me",
+            priority=Priority.BACKGROUND
         )
 
         if accounts_resp is not None and not isinstance(accounts_resp, dict):
@@ -515,11 +864,43 @@ async def login(
     password: str,
     websession: ClientSession = None,
     auth_only: bool = False,
+    scheduler: RequestScheduler = None,
+    token_store: TokenStore = None,
+    snapshot_path: Optional[str] = None,
+    connections: ConnectionManager = None,
+    metrics: MetricsRegistry = None,
+    transport: Transport = None,
+    endpoints: Endpoints = None,
+    retry_policy: RetryPolicy = None,
+    timeouts: Timeouts = None,
 ) -> API:
-    """Log in to the API."""
+    """Log in to the API.
+
+    With a token_store, a still-valid token from a previous run is reused instead of logging in.
+    With a snapshot_path, devices are restored from the snapshot if there is one and returned
+    straight away, marked stale, while authentication and a live update run in the background
+    (see API.refresh_task); the snapshot is saved again after every login.
+    """
 
     # Set the user agent in the headers.
-    api = API(username=username, password=password, websession=websession)
+    api = API(
+        username=username,
+        password=password,
+        websession=websession,
+        scheduler=scheduler,
+        token_store=token_store,
+        connections=connections,
+        metrics=metrics,
+        transport=transport,
+        endpoints=endpoints,
+        retry_policy=retry_policy,
+        timeouts=timeouts,
+    )
+    if snapshot_path is not None and not auth_only and await api.load_snapshot(snapshot_path):
+        _LOGGER.debug("Restored devices from snapshot, refreshing in the background")
+        api.refresh_in_background(snapshot_path)
+        return api
+
     _LOGGER.debug("Performing initial authentication into Hubspace")
     try:
         await api.authenticate(wait=True)
@@ -534,5 +915,7 @@ async def login(
         # Retrieve and store initial set of devices:
         _LOGGER.debug("Retrieving Hubspace information")
         await api.update_accounts()
+        if snapshot_path is not None:
+            await api.save_snapshot(snapshot_path)
 
     return api
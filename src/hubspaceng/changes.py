@@ -0,0 +1,61 @@
+"""Structured descriptions of what changed between updates from the API server"""
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Optional
+
+@dataclass(frozen=True)
+class StateChange:
+    """A function on a device changed value"""
+    device_id: str
+    function_class: str
+    function_instance: Optional[str]
+    old_value: Any
+    new_value: Any
+    timestamp: datetime
+
+@dataclass(frozen=True)
+class MembershipChange:
+    """A child was linked to or unlinked from a parent: a room in a home, a device in a room or combo device"""
+    parent_id: str
+    child_id: str
+    linked: bool
+
+@dataclass
+class ChangeSet:
+    """Everything that changed for an account in a single update"""
+    added: list[str] = field(default_factory=list)
+    removed: list[str] = field(default_factory=list)
+    memberships: list[MembershipChange] = field(default_factory=list)
+    states: list[StateChange] = field(default_factory=list)
+    # True if the update was skipped inside the throttle window, so nothing was fetched
+    throttled: bool = False
+
+    def __bool__(self) -> bool:
+        return bool(self.added or self.removed or self.memberships or self.states)
+
+    @property
+    def changed_device_ids(self) -> set[str]:
+        """Return the ids of every device or place touched by this change set"""
+        changed = set(self.added) | set(self.removed)
+        changed.update(change.parent_id for change in self.memberships)
+        changed.update(change.device_id for change in self.states)
+        return changed
+
+    def extend(self, other: "ChangeSet") -> None:
+        """Append the changes from another change set"""
+        self.added.extend(other.added)
+        self.removed.extend(other.removed)
+        self.memberships.extend(other.memberships)
+        self.states.extend(other.states)
+
+@dataclass
+class AccountUpdateResult:
+    """The outcome of updating one account: what changed, or the error it failed with"""
+    account_id: str
+    changes: ChangeSet = field(default_factory=ChangeSet)
+    error: Optional[Exception] = None
+
+    @property
+    def ok(self) -> bool:
+        """Return whether the account updated successfully"""
+        return self.error is None
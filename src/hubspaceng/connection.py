@@ -0,0 +1,84 @@
+"""Shared, pooled HTTP connections for authentication and API requests"""
+import logging
+from typing import Optional
+
+from aiohttp import ClientSession, TCPConnector
+
+from hubspaceng.const import (
+    DEFAULT_CONNECTION_LIMIT,
+    DEFAULT_CONNECTION_LIMIT_PER_HOST,
+    DEFAULT_DNS_CACHE_TTL,
+    DEFAULT_KEEPALIVE_TIMEOUT
+)
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class ConnectionManager:
+    """Own one connection pool, shared by the API session and every login
+
+    API requests go through a single long-lived session. Each login gets its own session,
+    and so its own cookie jar, on top of the same pool, so TLS connections to the API and
+    OAuth hosts are kept alive and reused across refreshes and re-authentication.
+
+    If a websession is given, its connector is shared instead and neither is closed by this
+    manager; the caller remains responsible for closing it.
+    """
+
+    def __init__(
+        self,
+        websession: Optional[ClientSession] = None,
+        limit: int = DEFAULT_CONNECTION_LIMIT,
+        limit_per_host: int = DEFAULT_CONNECTION_LIMIT_PER_HOST,
+        ttl_dns_cache: Optional[int] = DEFAULT_DNS_CACHE_TTL,
+        keepalive_timeout: float = DEFAULT_KEEPALIVE_TIMEOUT,
+    ) -> None:
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.ttl_dns_cache = ttl_dns_cache
+        self.keepalive_timeout = keepalive_timeout
+        self._websession = websession
+        self._owns_session = websession is None
+        self._connector = None  # type: Optional[TCPConnector]
+
+    @property
+    def closed(self) -> bool:
+        """Return whether the API session has been closed"""
+        return self._websession is not None and self._websession.closed
+
+    @property
+    def connector(self) -> TCPConnector:
+        """Return the shared connector, creating it on first use"""
+        if not self._owns_session:
+            return self._websession.connector
+        if self._connector is None or self._connector.closed:
+            # Created lazily, as a connector must be created inside the running event loop
+            self._connector = TCPConnector(
+                limit=self.limit,
+                limit_per_host=self.limit_per_host,
+                ttl_dns_cache=self.ttl_dns_cache,
+                use_dns_cache=self.ttl_dns_cache is not None,
+                keepalive_timeout=self.keepalive_timeout,
+            )
+        return self._connector
+
+    @property
+    def session(self) -> ClientSession:
+        """Return the session used for API requests"""
+        if self._websession is None or (self._owns_session and self._websession.closed):
+            self._websession = ClientSession(connector=self.connector, connector_owner=False)
+        return self._websession
+
+    def auth_session(self) -> ClientSession:
+        """Return a new session with an empty cookie jar on the shared pool, for one login"""
+        return ClientSession(connector=self.connector, connector_owner=False)
+
+    async def close(self) -> None:
+        """Close the session and connection pool, unless they were provided by the caller"""
+        if not self._owns_session:
+            return
+        if self._websession is not None and not self._websession.closed:
+            await self._websession.close()
+        if self._connector is not None and not self._connector.closed:
+            await self._connector.close()
+        _LOGGER.debug("Closed Hubspace connections")
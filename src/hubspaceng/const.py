@@ -12,6 +12,69 @@ METADATA_API_HOST = "api2.afero.net"
 
 USER_AGENT = "Dart/2.15 (dart:io)"
 
+# Minimum time between refreshes of every account via API.update_accounts, which also lists accounts
 DEFAULT_STATE_UPDATE_INTERVAL = timedelta(seconds=10)
+# Minimum time between refreshes of one account via HubspaceAccount.update. Shorter, as it is one
+# request for a single account, and it must stay below DEFAULT_STATE_UPDATE_INTERVAL or
+# API.update_accounts would find accounts still throttled and report no changes for them
+DEFAULT_ACCOUNT_UPDATE_INTERVAL = timedelta(seconds=5)
 DEFAULT_TOKEN_REFRESH = 10 * 60  # 10 minutes
+# Where FileTokenStore keeps tokens between runs when no path is given
+DEFAULT_TOKEN_FILE = "~/.cache/hubspaceng/tokens.json"
+# Stored access tokens closer than this to expiry are renewed instead of reused
+STORED_TOKEN_MIN_LIFETIME = 60  # seconds
 WAIT_TIMEOUT = 60
+
+# Request scheduling; the Hubspace API can time out under heavy concurrent load
+DEFAULT_MAX_CONCURRENT_REQUESTS = 4
+DEFAULT_MAX_CONCURRENT_REQUESTS_PER_HOST = 3
+DEFAULT_REQUEST_RATE = 5.0  # requests per second
+DEFAULT_REQUEST_BURST = 20
+DEFAULT_RESERVED_INTERACTIVE_SLOTS = 1
+# Tokens of the burst only interactive requests may spend, enough for a group command across
+# a room without waiting on the rate; polling still bursts to only 10
+DEFAULT_RESERVED_INTERACTIVE_TOKENS = 10
+
+# Retries of failed requests; see hubspaceng.retry.RetryPolicy
+DEFAULT_REQUEST_RETRIES = 5  # attempts, including the first
+DEFAULT_RETRY_BASE_DELAY = 0.5  # seconds
+DEFAULT_RETRY_MAX_DELAY = 5  # seconds
+DEFAULT_RETRY_AFTER_MAX = 60  # seconds; longer Retry-After waits fail the request instead
+DEFAULT_RETRY_BUDGET_RATE = 0.5  # retries per second per host
+DEFAULT_RETRY_BUDGET_BURST = 10
+DEFAULT_CIRCUIT_FAILURE_THRESHOLD = 5  # consecutive failures before failing fast
+DEFAULT_CIRCUIT_RESET_TIMEOUT = 30  # seconds
+
+# Default deadlines per operation; see hubspaceng.deadline.Timeouts
+DEFAULT_REQUEST_TIMEOUT = 30  # seconds, including queue wait, token refresh and retries
+DEFAULT_AUTH_TIMEOUT = 60  # seconds
+DEFAULT_SET_STATE_TIMEOUT = 30  # seconds
+DEFAULT_UPDATE_TIMEOUT = 60  # seconds
+DEFAULT_UPDATE_ACCOUNTS_TIMEOUT = 120  # seconds
+
+# Connection pool shared by authentication and API requests
+DEFAULT_CONNECTION_LIMIT = 10
+DEFAULT_CONNECTION_LIMIT_PER_HOST = 4
+DEFAULT_DNS_CACHE_TTL = 300  # seconds
+DEFAULT_KEEPALIVE_TIMEOUT = 60  # seconds
+
+# Most device commands in flight at once for a Room/Home/Account group command
+DEFAULT_GROUP_CONCURRENCY = 8
+
+# Window for collapsing rapid state changes on functions with coalescing enabled
+DEFAULT_COALESCE_WINDOW = 0.25  # seconds
+
+# Adaptive per-device polling
+DEFAULT_POLL_MIN_INTERVAL = 5  # seconds
+DEFAULT_POLL_MAX_INTERVAL = 300  # seconds
+DEFAULT_POLL_BACKOFF = 2.0
+DEFAULT_POLL_REQUEST_BUDGET = 30  # requests per minute
+DEFAULT_POLL_DEVICE_LIST_INTERVAL = 300  # seconds
+
+# State change subscriptions
+DEFAULT_SUBSCRIPTION_QUEUE_SIZE = 100
+DEFAULT_SUBSCRIPTION_BLOCK_TIMEOUT = 1.0  # seconds
+DEFAULT_SUBSCRIPTION_DISPATCH_BACKLOG = 100  # published batches awaiting BLOCK subscribers
+
+# Function definition indexes kept for recently seen device descriptions
+FUNCTION_INDEX_CACHE_SIZE = 256
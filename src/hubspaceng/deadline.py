@@ -0,0 +1,75 @@
+"""Deadlines shared by everything an operation awaits: queueing, authentication and retries"""
+import asyncio
+from contextvars import ContextVar
+from dataclasses import dataclass
+import time
+from typing import Awaitable, Optional, TypeVar
+
+from hubspaceng.const import (
+    DEFAULT_AUTH_TIMEOUT,
+    DEFAULT_REQUEST_TIMEOUT,
+    DEFAULT_SET_STATE_TIMEOUT,
+    DEFAULT_UPDATE_ACCOUNTS_TIMEOUT,
+    DEFAULT_UPDATE_TIMEOUT
+)
+from hubspaceng.errors import DeadlineExceededError
+
+T = TypeVar("T")
+
+# When the operation running in the current task must finish, in time.monotonic() seconds
+_DEADLINE: ContextVar[Optional[float]] = ContextVar("hubspace_deadline", default=None)
+
+
+@dataclass
+class Timeouts:
+    """Default deadlines per operation, in seconds; None means no deadline"""
+    request: Optional[float] = DEFAULT_REQUEST_TIMEOUT
+    auth: Optional[float] = DEFAULT_AUTH_TIMEOUT
+    set_state: Optional[float] = DEFAULT_SET_STATE_TIMEOUT
+    update: Optional[float] = DEFAULT_UPDATE_TIMEOUT
+    update_accounts: Optional[float] = DEFAULT_UPDATE_ACCOUNTS_TIMEOUT
+
+
+def remaining() -> Optional[float]:
+    """Return the seconds left before the current deadline, or None if there is none"""
+    deadline = _DEADLINE.get()
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+
+def clear_deadline() -> None:
+    """Drop the deadline inherited by the current task, e.g. for a task shared by many callers"""
+    _DEADLINE.set(None)
+
+
+async def with_deadline(awaitable: Awaitable[T], timeout: Optional[float], operation: str) -> T:
+    """Await within timeout seconds and any deadline already set by the caller, whichever is sooner
+
+    Everything awaited inside shares the deadline. When it passes, the awaitable is
+    cancelled and DeadlineExceededError is raised.
+    """
+    deadline = _DEADLINE.get()
+    if timeout is not None:
+        own_deadline = time.monotonic() + timeout
+        deadline = own_deadline if deadline is None else min(deadline, own_deadline)
+    if deadline is None:
+        return await awaitable
+
+    left = deadline - time.monotonic()
+    if left <= 0:
+        if asyncio.iscoroutine(awaitable):
+            awaitable.close()
+        raise DeadlineExceededError(f"{operation} did not start before its deadline")
+
+    token = _DEADLINE.set(deadline)
+    try:
+        # wait_for runs the awaitable in a task copying this context, deadline included
+        return await asyncio.wait_for(awaitable, left)
+    except asyncio.TimeoutError as err:
+        if time.monotonic() < deadline:
+            # A timeout from inside the operation, such as a socket read timeout
+            raise
+        raise DeadlineExceededError(f"{operation} did not complete within its deadline") from err
+    finally:
+        _DEADLINE.reset(token)
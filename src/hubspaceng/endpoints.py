@@ -0,0 +1,41 @@
+"""Base URLs for the Hubspace services, overridable to point at a local server"""
+from dataclasses import dataclass
+
+from hubspaceng.const import (
+    BASE_API_ENDPOINT,
+    HUBSPACE_OAUTH_REALM,
+    METADATA_API_CALLING_HOST,
+    METADATA_API_HOST
+)
+
+
+@dataclass(frozen=True)
+class Endpoints:
+    """Where the API sends requests; defaults to the production hosts in const.py"""
+    oauth_realm: str = HUBSPACE_OAUTH_REALM
+    api_base: str = BASE_API_ENDPOINT
+    metadata_base: str = f"https://{METADATA_API_HOST}/v1"
+    # Sent as the Host header on metadata requests
+    metadata_calling_host: str = METADATA_API_CALLING_HOST
+
+    @classmethod
+    def from_base_url(cls, base_url: str) -> "Endpoints":
+        """Serve every endpoint from one base URL, as hubspaceng.tools.fake_server does"""
+        base_url = base_url.rstrip("/")
+        return cls(
+            oauth_realm=f"{base_url}/auth/realms/thd",
+            api_base=f"{base_url}/v1",
+            metadata_base=f"{base_url}/v1",
+            metadata_calling_host=base_url.split("://", 1)[-1],
+        )
+
+    def metadevices_url(self, account_id: str) -> str:
+        """Return the URL listing an account's metadevices"""
+        return f"{self.metadata_base}/accounts/{account_id}/metadevices"
+
+    def state_url(self, account_id: str, device_id: str) -> str:
+        """Return the URL for a metadevice's state"""
+        return f"{self.metadevices_url(account_id)}/{device_id}/state"
+
+
+DEFAULT_ENDPOINTS = Endpoints()
@@ -10,3 +10,9 @@ class AuthenticationError(HubspaceError):
 
 class RequestError(HubspaceError):
     """Define an exception related to bad HTTP requests."""
+
+class CircuitOpenError(RequestError):
+    """Define an exception for requests refused while a host keeps failing."""
+
+class DeadlineExceededError(RequestError):
+    """Define an exception for operations that did not complete within their deadline."""
@@ -0,0 +1,276 @@
+"""Subscriptions to state changes, delivered as async iterators"""
+import asyncio
+from collections import OrderedDict, deque
+from dataclasses import dataclass, replace
+from enum import Enum
+from itertools import count
+import logging
+from typing import TYPE_CHECKING, Deque, Dict, Iterable, List, Optional, Tuple
+
+from hubspaceng.changes import StateChange
+from hubspaceng.const import (
+    DEFAULT_SUBSCRIPTION_BLOCK_TIMEOUT,
+    DEFAULT_SUBSCRIPTION_DISPATCH_BACKLOG,
+    DEFAULT_SUBSCRIPTION_QUEUE_SIZE
+)
+from hubspaceng.models.devices.combo import ComboDevice
+
+if TYPE_CHECKING:
+    from hubspaceng.api import API
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class OverflowPolicy(Enum):
+    """What a subscription does with a new event when its queue is full"""
+    # Discard the oldest queued event
+    DROP_OLDEST = "drop_oldest"
+    # Merge events for the same device function; discard the oldest when a new function arrives
+    COALESCE = "coalesce"
+    # Make the bus's dispatcher wait for space, up to the bus's block timeout per publish
+    BLOCK = "block"
+
+
+@dataclass(frozen=True)
+class SubscriptionFilter:
+    """Limit a subscription to matching state changes; a None criterion matches everything"""
+    device_ids: Optional[frozenset] = None
+    device_classes: Optional[frozenset] = None
+    room_ids: Optional[frozenset] = None
+    function_classes: Optional[frozenset] = None
+
+    def matches(self, event: StateChange, devices: dict, device_rooms: Dict[str, set]) -> bool:
+        """Return whether an event passes this filter"""
+        if self.device_ids is not None and event.device_id not in self.device_ids:
+            return False
+        if self.function_classes is not None and event.function_class not in self.function_classes:
+            return False
+        if self.device_classes is not None:
+            device = devices.get(event.device_id)
+            if device is None or device.device_class not in self.device_classes:
+                return False
+        if self.room_ids is not None and not device_rooms.get(event.device_id, set()) & self.room_ids:
+            return False
+        return True
+
+
+class Subscription:
+    """An async iterator of state changes with its own bounded queue"""
+
+    def __init__(
+        self,
+        bus: "EventBus",
+        event_filter: SubscriptionFilter,
+        maxsize: int = DEFAULT_SUBSCRIPTION_QUEUE_SIZE,
+        policy: OverflowPolicy = OverflowPolicy.DROP_OLDEST,
+    ) -> None:
+        if maxsize < 1:
+            raise ValueError("Subscription queue size must be at least 1")
+        self._bus = bus
+        self.filter = event_filter
+        self.maxsize = maxsize
+        self.policy = policy
+        self.dropped = 0
+        self._events = OrderedDict()  # type: OrderedDict
+        self._sequence = count()
+        self._readable = asyncio.Event()
+        self._writable = asyncio.Event()
+        self._writable.set()
+        self._closed = False
+
+    @property
+    def closed(self) -> bool:
+        """Return whether the subscription has been closed"""
+        return self._closed
+
+    def qsize(self) -> int:
+        """Return the number of queued events"""
+        return len(self._events)
+
+    def _key(self, event: StateChange):
+        if self.policy == OverflowPolicy.COALESCE:
+            return (event.device_id, event.function_class, event.function_instance)
+        return next(self._sequence)
+
+    def offer_nowait(self, event: StateChange) -> bool:
+        """Queue an event without waiting; returns False if it could not be queued"""
+        if self._closed:
+            return False
+        key = self._key(event)
+        if key in self._events:
+            # Coalesce, keeping the value from before the first queued change
+            event = replace(event, old_value=self._events.pop(key).old_value)
+        elif len(self._events) >= self.maxsize:
+            if self.policy == OverflowPolicy.BLOCK:
+                return False
+            self._events.popitem(last=False)
+            self.dropped += 1
+        self._events[key] = event
+        if len(self._events) >= self.maxsize:
+            self._writable.clear()
+        self._readable.set()
+        return True
+
+    async def offer(self, event: StateChange, timeout: float) -> bool:
+        """Queue an event, waiting up to `timeout` seconds for space under the BLOCK policy"""
+        while not self.offer_nowait(event):
+            if self._closed:
+                return False
+            try:
+                await asyncio.wait_for(self._writable.wait(), max(timeout, 0))
+            except asyncio.TimeoutError:
+                return False
+        return True
+
+    async def get(self) -> StateChange:
+        """Wait for and return the next event; raises StopAsyncIteration once closed and drained"""
+        while not self._events:
+            if self._closed:
+                raise StopAsyncIteration
+            self._readable.clear()
+            await self._readable.wait()
+        _, event = self._events.popitem(last=False)
+        self._writable.set()
+        return event
+
+    def close(self) -> None:
+        """Stop receiving events; queued events can still be read"""
+        if not self._closed:
+            self._closed = True
+            self._bus.unsubscribe(self)
+            self._readable.set()
+            self._writable.set()
+
+    def __aiter__(self) -> "Subscription":
+        return self
+
+    async def __anext__(self) -> StateChange:
+        return await self.get()
+
+    async def __aenter__(self) -> "Subscription":
+        return self
+
+    async def __aexit__(self, exc_type, exc, traceback) -> None:
+        self.close()
+
+
+class EventBus:
+    """Fans state changes out to subscriptions
+
+    Publishing never waits on subscribers. DROP_OLDEST and COALESCE subscribers are
+    delivered to as events are published. Events for BLOCK subscribers are handed to a
+    dispatcher task, which delivers each publish in order, to every BLOCK subscriber
+    concurrently, sharing one `block_timeout`; events that do not fit in time are dropped.
+    At most `backlog` publishes wait for the dispatcher; beyond that the oldest is dropped.
+    """
+
+    def __init__(
+        self,
+        api: "API",
+        block_timeout: float = DEFAULT_SUBSCRIPTION_BLOCK_TIMEOUT,
+        backlog: int = DEFAULT_SUBSCRIPTION_DISPATCH_BACKLOG,
+    ) -> None:
+        self._api = api
+        self.block_timeout = block_timeout
+        self.backlog = backlog
+        self._subscriptions = []  # type: list[Subscription]
+        self._pending = deque()  # type: Deque[List[Tuple[Subscription, list]]]
+        self._dispatcher = None  # type: Optional[asyncio.Task]
+
+    @property
+    def subscriptions(self) -> list[Subscription]:
+        """Return the open subscriptions"""
+        return list(self._subscriptions)
+
+    def subscribe(
+        self,
+        device_ids: Optional[Iterable[str]] = None,
+        device_classes: Optional[Iterable[str]] = None,
+        room_ids: Optional[Iterable[str]] = None,
+        function_classes: Optional[Iterable[str]] = None,
+        maxsize: int = DEFAULT_SUBSCRIPTION_QUEUE_SIZE,
+        policy: OverflowPolicy = OverflowPolicy.DROP_OLDEST,
+    ) -> Subscription:
+        """Subscribe to state changes matching every given criterion"""
+        def as_set(values):
+            return frozenset(values) if values is not None else None
+        event_filter = SubscriptionFilter(
+            as_set(device_ids), as_set(device_classes), as_set(room_ids), as_set(function_classes)
+        )
+        subscription = Subscription(self, event_filter, maxsize, policy)
+        self._subscriptions.append(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        """Stop delivering events to a subscription"""
+        if subscription in self._subscriptions:
+            self._subscriptions.remove(subscription)
+
+    def _device_rooms(self) -> Dict[str, set]:
+        device_rooms = {}
+        for room in self._api.rooms.values():
+            for device in room.devices.values():
+                device_rooms.setdefault(device.id, set()).add(room.id)
+                if isinstance(device, ComboDevice):
+                    for child in device.children.values():
+                        device_rooms.setdefault(child.id, set()).add(room.id)
+        return device_rooms
+
+    async def publish(self, events: Iterable[StateChange]) -> None:
+        """Deliver events to every subscription whose filter they match, without waiting on subscribers"""
+        events = list(events)
+        if not events or not self._subscriptions:
+            return
+
+        devices = self._api.devices
+        device_rooms = self._device_rooms() if any(
+            subscription.filter.room_ids is not None for subscription in self._subscriptions
+        ) else {}
+
+        blocking = []
+        for subscription in list(self._subscriptions):
+            matched = [event for event in events if subscription.filter.matches(event, devices, device_rooms)]
+            if not matched:
+                continue
+            if subscription.policy == OverflowPolicy.BLOCK:
+                blocking.append((subscription, matched))
+            else:
+                for event in matched:
+                    subscription.offer_nowait(event)
+        if blocking:
+            self._dispatch(blocking)
+
+    def _dispatch(self, deliveries: List[Tuple[Subscription, list]]) -> None:
+        if len(self._pending) >= self.backlog:
+            for subscription, matched in self._pending.popleft():
+                subscription.dropped += len(matched)
+            _LOGGER.debug("Event dispatcher is behind, dropped the oldest publish")
+        self._pending.append(deliveries)
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.create_task(self._run_dispatcher())
+
+    async def _run_dispatcher(self) -> None:
+        while self._pending:
+            deliveries = self._pending.popleft()
+            deadline = asyncio.get_running_loop().time() + self.block_timeout
+
+            async def deliver_blocking(subscription: Subscription, matched: list):
+                for index, event in enumerate(matched):
+                    remaining = deadline - asyncio.get_running_loop().time()
+                    if not await subscription.offer(event, remaining):
+                        subscription.dropped += len(matched) - index
+                        _LOGGER.debug("Subscriber too slow, dropped %s events", len(matched) - index)
+                        return
+
+            await asyncio.gather(*(deliver_blocking(subscription, matched) for subscription, matched in deliveries))
+
+    async def close(self) -> None:
+        """Stop the dispatcher, dropping events not yet delivered to BLOCK subscribers"""
+        self._pending.clear()
+        if self._dispatcher is not None and not self._dispatcher.done():
+            self._dispatcher.cancel()
+            try:
+                await self._dispatcher
+            except asyncio.CancelledError:
+                pass
+        self._dispatcher = None
@@ -0,0 +1,216 @@
+"""Request, queue, authentication and polling metrics, with a Prometheus text renderer"""
+from bisect import bisect_left
+import math
+import re
+from typing import Dict, Iterable, Optional, Tuple, Union
+
+from yarl import URL
+
+# Upper bounds, in seconds, of the histogram buckets
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Path segments that are ids rather than part of the endpoint: UUIDs, long hex strings and numbers
+_ID_SEGMENT = re.compile(
+    r"^(?:[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}|[0-9a-f]{12,}|\d+)$",
+    re.IGNORECASE,
+)
+
+
+def endpoint_template(url: Union[URL, str]) -> str:
+    """Return the host and path of a URL with ids replaced by {id} and the query string dropped"""
+    url = URL(url)
+    segments = ["{id}" if _ID_SEGMENT.match(segment) else segment for segment in url.path.split("/")]
+    return f"{url.host or ''}{'/'.join(segments)}"
+
+
+class Histogram:
+    """Cumulative histogram of observed values, in the style of a Prometheus histogram"""
+
+    def __init__(self, buckets: Iterable[float] = DEFAULT_BUCKETS) -> None:
+        self.buckets = tuple(sorted(buckets))
+        self._counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float) -> None:
+        """Record a value"""
+        self._counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def cumulative(self) -> list[Tuple[float, int]]:
+        """Return (upper bound, observations at or below it) for every bucket, ending with +Inf"""
+        total = 0
+        result = []
+        for bound, count in zip(self.buckets + (math.inf,), self._counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+    def snapshot(self) -> dict:
+        """Return the histogram as a JSON-serializable dict"""
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "mean": self.sum / self.count if self.count else 0.0,
+            "max": self.max,
+            "buckets": {_format_bound(bound): count for bound, count in self.cumulative()},
+        }
+
+
+class EndpointMetrics:
+    """Metrics for requests to a single method and endpoint template"""
+
+    def __init__(self, buckets: Iterable[float]) -> None:
+        self.latency = Histogram(buckets)
+        self.statuses = {}  # type: Dict[str, int]
+        self.retries = 0
+        self.backoff = 0.0
+
+    def snapshot(self) -> dict:
+        """Return the endpoint metrics as a JSON-serializable dict"""
+        return dict(
+            self.latency.snapshot(),
+            statuses=dict(self.statuses),
+            retries=self.retries,
+            backoff_seconds=self.backoff,
+        )
+
+
+class MetricsRegistry:
+    """Collects metrics for an API instance; see API.metrics"""
+
+    def __init__(self, buckets: Iterable[float] = DEFAULT_BUCKETS) -> None:
+        self.buckets = tuple(buckets)
+        self._requests = {}  # type: Dict[Tuple[str, str], EndpointMetrics]
+        self._queue_wait = {}  # type: Dict[str, Histogram]
+        self._auth = {}  # type: Dict[str, Histogram]
+        self._poll_cycle = Histogram(self.buckets)
+
+    def _endpoint(self, method: str, url: Union[URL, str]) -> EndpointMetrics:
+        key = (method.upper(), endpoint_template(url))
+        endpoint = self._requests.get(key)
+        if endpoint is None:
+            endpoint = self._requests[key] = EndpointMetrics(self.buckets)
+        return endpoint
+
+    def _histogram(self, histograms: Dict[str, Histogram], name: str) -> Histogram:
+        histogram = histograms.get(name)
+        if histogram is None:
+            histogram = histograms[name] = Histogram(self.buckets)
+        return histogram
+
+    def observe_request(self, method: str, url: Union[URL, str], status: Optional[int], duration: float) -> None:
+        """Record one HTTP attempt; a status of None means no response was received"""
+        endpoint = self._endpoint(method, url)
+        endpoint.latency.observe(duration)
+        status = str(status) if status is not None else "error"
+        endpoint.statuses[status] = endpoint.statuses.get(status, 0) + 1
+
+    def observe_retry(self, method: str, url: Union[URL, str], backoff: float) -> None:
+        """Record a retried request and how long it slept before retrying"""
+        endpoint = self._endpoint(method, url)
+        endpoint.retries += 1
+        endpoint.backoff += backoff
+
+    def observe_queue_wait(self, priority: str, wait: float) -> None:
+        """Record how long a request waited for a scheduler slot"""
+        self._histogram(self._queue_wait, priority).observe(wait)
+
+    def observe_auth(self, kind: str, duration: float) -> None:
+        """Record how long obtaining a token took, by kind (login, refresh or stored)"""
+        self._histogram(self._auth, kind).observe(duration)
+
+    def observe_poll_cycle(self, duration: float) -> None:
+        """Record how long one polling cycle took"""
+        self._poll_cycle.observe(duration)
+
+    def reset(self) -> None:
+        """Discard everything recorded so far"""
+        self._requests.clear()
+        self._queue_wait.clear()
+        self._auth.clear()
+        self._poll_cycle = Histogram(self.buckets)
+
+    def snapshot(self) -> dict:
+        """Return every metric as a JSON-serializable dict"""
+        return {
+            "requests": {
+                f"{method} {endpoint}": metrics.snapshot()
+                for (method, endpoint), metrics in sorted(self._requests.items())
+            },
+            "queue_wait": {name: hist.snapshot() for name, hist in sorted(self._queue_wait.items())},
+            "auth": {name: hist.snapshot() for name, hist in sorted(self._auth.items())},
+            "poll_cycle": self._poll_cycle.snapshot(),
+        }
+
+    def render_prometheus(self, prefix: str = "hubspace") -> str:
+        """Return every metric in the Prometheus text exposition format"""
+        lines = []
+        requests = sorted(self._requests.items())
+
+        _render_histograms(
+            lines, f"{prefix}_request_duration_seconds", "Latency of HTTP requests to the Hubspace API",
+            [({"method": method, "endpoint": endpoint}, metrics.latency) for (method, endpoint), metrics in requests],
+        )
+
+        name = f"{prefix}_responses_total"
+        lines.append(f"# HELP {name} HTTP responses by status; status is error when no response was received")
+        lines.append(f"# TYPE {name} counter")
+        for (method, endpoint), metrics in requests:
+            for status, count in sorted(metrics.statuses.items()):
+                lines.append(f"{name}{_labels(method=method, endpoint=endpoint, status=status)} {count}")
+
+        for name, help_text, attribute in (
+            (f"{prefix}_request_retries_total", "Retried HTTP requests", "retries"),
+            (f"{prefix}_retry_backoff_seconds_total", "Time spent sleeping before retries", "backoff"),
+        ):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} counter")
+            for (method, endpoint), metrics in requests:
+                value = _format_value(getattr(metrics, attribute))
+                lines.append(f"{name}{_labels(method=method, endpoint=endpoint)} {value}")
+
+        _render_histograms(
+            lines, f"{prefix}_queue_wait_seconds", "Time requests waited for a scheduler slot",
+            [({"priority": name}, hist) for name, hist in sorted(self._queue_wait.items())],
+        )
+        _render_histograms(
+            lines, f"{prefix}_auth_duration_seconds", "Time taken to obtain a token",
+            [({"kind": name}, hist) for name, hist in sorted(self._auth.items())],
+        )
+        _render_histograms(
+            lines, f"{prefix}_poll_cycle_seconds", "Duration of polling cycles",
+            [({}, self._poll_cycle)],
+        )
+        return "\n".join(lines) + "\n"
+
+
+def _format_bound(bound: float) -> str:
+    return "+Inf" if math.isinf(bound) else repr(float(bound))
+
+
+def _format_value(value: Union[int, float]) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(**labels: str) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(str(value))}"' for key, value in labels.items()) + "}"
+
+
+def _render_histograms(lines: list, name: str, help_text: str, series: list[Tuple[dict, Histogram]]) -> None:
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} histogram")
+    for labels, hist in series:
+        for bound, count in hist.cumulative():
+            lines.append(f"{name}_bucket{_labels(**labels, le=_format_bound(bound))} {count}")
+        lines.append(f"{name}_sum{_labels(**labels)} {_format_value(hist.sum)}")
+        lines.append(f"{name}_count{_labels(**labels)} {hist.count}")
@@ -1,15 +1,27 @@
 """Basic implementation of a device in the Hubspace API"""
+from collections import OrderedDict
 from datetime import datetime
 import logging
 from typing import TYPE_CHECKING, Optional
 
+from hubspaceng.const import FUNCTION_INDEX_CACHE_SIZE, USER_AGENT
+from hubspaceng.changes import StateChange
+from hubspaceng.deadline import with_deadline
+from hubspaceng.errors import DeadlineExceededError, RequestError
+from hubspaceng.models.devices.batch import DeviceBatch, get_active_batch
 from hubspaceng.models.functions.base import BaseFunction
+from hubspaceng.scheduler import Priority
+from hubspaceng.util import index_state_values
 
 if TYPE_CHECKING:
     from hubspaceng.account import HubspaceAccount
 
 _LOGGER = logging.getLogger(__name__)
 
+# Indexes of recently seen descriptions by id(); each entry holds its description so the id
+# cannot be reused by another object while it is cached
+_FUNCTION_INDEXES = OrderedDict()  # type: OrderedDict
+
 class BaseDevice:
     """Basic implementation of a device"""
     _functions: list[BaseFunction]
@@ -21,13 +33,19 @@ class BaseDevice:
         device_json: dict,
         account: "HubspaceAccount",
         state_update: datetime,
+        function_index: Optional["FunctionIndex"] = None,
     ) -> None:
         """Initialize."""
         self._account = account
         self.device_json = device_json
         self._id = device_json.get("id")
         self._functions = []
+        self._function_index = function_index or FunctionIndex.from_device_json(device_json)
+        self._indexed_description = device_json['description']
         self.last_state_update = state_update
+        self.last_state_write = None  # type: Optional[datetime]
+        # True while the state is from a snapshot and has not yet been refreshed from the API server
+        self.stale = False  # type: bool
 
     @property
     def api(self) -> "API":
@@ -64,6 +82,19 @@ class BaseDevice:
         """Return functions for with device"""
         return self._functions
 
+    def is_compatible(self, device_json: dict) -> bool:
+        """Return whether a fresh device JSON can be applied in place, without rebuilding this device"""
+        return (
+            device_json.get('typeId') == self.device_type
+            and device_json.get('description') == self.device_json.get('description')
+            and bool(device_json.get('children')) == bool(self.device_json.get('children'))
+        )
+
+    def update_json(self, device_json: dict, state_update: datetime):
+        """Replace the device JSON with a fresh copy from the API server"""
+        self.device_json = device_json
+        self.last_state_update = state_update
+
     def get_state(self, function: BaseFunction):
         """Get the current state for a function"""
         if function is None:
@@ -78,51 +109,183 @@ class BaseDevice:
         else:
             await function.set_state(new_value)
 
+    def _get_state_url(self) -> str:
+        return self.api.endpoints.state_url(self.account.id, self.id)
+
+    async def _get_remote_state_doc(self, priority: Priority = Priority.NORMAL) -> dict:
+        _, state_resp = await self.api.request(
+            method="get",
+            priority=priority,
+            returns="json",
+            url=self._get_state_url(),
+            headers = {
+                "user-agent": USER_AGENT,
+                "Accept": "application/json",
+                "accept-encoding": "gzip",
+                "host": self.api.endpoints.metadata_calling_host
+            }
+        )
+        return state_resp
+
+    async def _put_state_values(self, state_values: list[dict], priority: Priority = Priority.INTERACTIVE) -> dict:
+        payload = {
+            "metadeviceId": str(self.id),
+            "values": state_values
+        }
+        _, set_resp = await self.api.request(
+            method="PUT",
+            priority=priority,
+            returns="json",
+            url=self._get_state_url(),
+            headers = {
+                "user-agent": USER_AGENT,
+                "host": self.api.endpoints.metadata_calling_host,
+                "accept-encoding": "gzip",
+                "content-type": "application/json; charset=utf-8",
+            },
+            json = payload
+        )
+        self.last_state_write = datetime.utcnow()
+        return set_resp
+
+    def batch(self, priority: Priority = Priority.INTERACTIVE) -> DeviceBatch:
+        """Collect set_state calls for this device and send them in a single request
+
+        Usage:
+            async with light.batch():
+                await light.turn_on()
+                await light.set_brightness(40)
+        """
+        return DeviceBatch(self, priority)
+
+    @property
+    def active_batch(self) -> Optional[DeviceBatch]:
+        """Return the batch collecting changes for this device in the current task, if any"""
+        return get_active_batch(self)
+
+    async def refresh(self, priority: Priority = Priority.NORMAL, timeout: Optional[float] = None) -> list[StateChange]:
+        """Update every function on this device from a single state request to the API server
+
+        Must finish within timeout seconds, defaulting to `API.timeouts.update`, or
+        DeadlineExceededError is raised.
+        """
+        try:
+            state_doc = await with_deadline(
+                self._get_remote_state_doc(priority=priority),
+                self.api.timeouts.update if timeout is None else timeout,
+                f"Refreshing device {self.id}",
+            )
+        except DeadlineExceededError:
+            raise
+        except Exception as ex:
+            raise RequestError(f"Could not refresh device {self.id}") from ex
+        changes = self.hydrate(state_doc, datetime.utcnow())
+        await self.api.events.publish(changes)
+        return changes
+
+    def state_values(self) -> dict:
+        """Return the current value of each function, keyed by (functionClass, functionInstance)"""
+        return {function.state_key: function.get_state() for function in self._functions}
+
+    def hydrate(self, state_doc: Optional[dict], state_update: datetime) -> list[StateChange]:
+        """Update every function on this device from an already retrieved metadevice state document
+
+        Returns the functions whose value changed.
+        """
+        state_values = index_state_values(state_doc.get('values') if state_doc else None)
+        changes = []
+        for function in self._functions:
+            state_value = state_values.get(function.state_key)
+            if state_value is None:
+                continue
+            old_value = function.get_state()
+            try:
+                function.apply_state(state_value.get('value'), state_value.get('lastUpdateTime'))
+            except (TypeError, ValueError) as ex:
+                _LOGGER.debug("Ignoring state for %s on device %s: %s", function.title, self.id, ex)
+                continue
+            if function.get_state() != old_value:
+                changes.append(StateChange(
+                    self.id, function.func_class, function.func_instance,
+                    old_value, function.get_state(), state_update
+                ))
+        self.last_state_update = state_update
+        self.stale = False
+        return changes
+
+    @property
+    def function_index(self) -> "FunctionIndex":
+        """Return the index of this device's function definitions, rebuilt only when the description changes"""
+        description = self.device_json['description']
+        if description is not self._indexed_description:
+            # Each poll brings a new but usually equal description; keep the index unless it differs
+            if description != self._indexed_description:
+                self._function_index = FunctionIndex.for_description(description)
+            self._indexed_description = description
+        return self._function_index
+
     def filter_function_def(self, class_filter: str | list[str], type_filter: str, instance_filter: list[str | None] | None = None, allow_multiple:bool = False):
         """Find a function in the device json based on filter criteria"""
-        return filter_function_def(self.device_json, class_filter, type_filter=type_filter, instance_filter=instance_filter, allow_multiple=allow_multiple)
+        return self.function_index.find(class_filter, type_filter, instance_filter=instance_filter, allow_multiple=allow_multiple)
 
 
-def filter_function_def(device_json: dict, class_filter: str | list[str], type_filter: str, instance_filter: list[str | None] | None = None, allow_multiple:bool = False):
-    """Find a function in the device json based on filter criteria"""
-    raw_functions = device_json['description']['functions']
+class FunctionIndex:
+    """Index of a device description's function definitions by functionClass, type and functionInstance"""
+
+    def __init__(self, raw_functions: list[dict]):
+        self._index = {}
+        for position, raw_function in enumerate(raw_functions):
+            by_type = self._index.setdefault(raw_function.get('functionClass'), {})
+            by_instance = by_type.setdefault(raw_function.get('type'), {})
+            by_instance.setdefault(raw_function.get('functionInstance'), []).append((position, raw_function))
 
-    def filter_generator(field, value):
+    @classmethod
+    def for_description(cls, description: dict) -> "FunctionIndex":
+        """Return the index for a device description, built once while the description is in use"""
+        key = id(description)
+        cached = _FUNCTION_INDEXES.get(key)
+        if cached is not None and cached[0] is description:
+            _FUNCTION_INDEXES.move_to_end(key)
+            return cached[1]
+        index = cls(description['functions'])
+        _FUNCTION_INDEXES[key] = (description, index)
+        if len(_FUNCTION_INDEXES) > FUNCTION_INDEX_CACHE_SIZE:
+            _FUNCTION_INDEXES.popitem(last=False)
+        return index
+
+    @classmethod
+    def from_device_json(cls, device_json: dict) -> "FunctionIndex":
+        """Return the index for the functions in a device JSON's description"""
+        return cls.for_description(device_json['description'])
+
+    @staticmethod
+    def _select(mapping: dict, value) -> list:
         if value is None:
-            def match_def(_):
-                return True
-        elif isinstance(value, str):
-            def match_def(current_val):
-                return current_val.get(field) == value
-        else:
-            def match_def(current_val):
-                for curr_filter_val in value:
-                    if current_val.get(field) == curr_filter_val:
-                        return True
-                return False
-        return match_def
-
-    # Since we must have a class match and it will knock the most out of the list, check that first
-    raw_functions = list(filter(filter_generator('functionClass', class_filter), raw_functions))
-    if len(raw_functions) == 0:
-        return None
-
-    # We also must have a type match
-    raw_functions = list(filter(filter_generator('type', type_filter), raw_functions))
-    if len(raw_functions) == 0:
-        return None
-
-    # Only check for instance_filter if it is defined
-    if instance_filter is not None:
-        raw_functions = list(filter(filter_generator('functionInstance', instance_filter), raw_functions))
-        if len(raw_functions) == 0:
+            return list(mapping.values())
+        if isinstance(value, str):
+            return [mapping[value]] if value in mapping else []
+        return [mapping[key] for key in dict.fromkeys(value) if key in mapping]
+
+    def find(self, class_filter: str | list[str], type_filter: str, instance_filter: list[str | None] | None = None, allow_multiple:bool = False):
+        """Find a function definition based on filter criteria"""
+        matches = []
+        for by_type in self._select(self._index, class_filter):
+            for by_instance in self._select(by_type, type_filter):
+                for entries in self._select(by_instance, instance_filter):
+                    matches.extend(entries)
+        if len(matches) == 0:
             return None
 
-    # If there are multiple, handle it
-    if len(raw_functions) > 1:
-        if allow_multiple:
-            return raw_functions
+        # If there are multiple, handle it
+        if len(matches) > 1:
+            if allow_multiple:
+                return [raw_function for _, raw_function in sorted(matches, key=lambda entry: entry[0])]
+            else:
+                return ValueError(f"Filter (class:{class_filter}, type:{type_filter}, instance:{instance_filter}) had {len(matches)} matches, but only a single match was allowed.")
         else:
-            return ValueError(f"Filter (class:{class_filter}, type:{type_filter}, instance:{instance_filter}) had {len(raw_functions)} matches, but only a single match was allowed.")
-    else:
-        return raw_functions[0]
\ No newline at end of file
+            return matches[0][1]
+
+
+def filter_function_def(device_json: dict, class_filter: str | list[str], type_filter: str, instance_filter: list[str | None] | None = None, allow_multiple:bool = False):
+    """Find a function in the device json based on filter criteria, indexing its description once"""
+    return FunctionIndex.from_device_json(device_json).find(class_filter, type_filter, instance_filter=instance_filter, allow_multiple=allow_multiple)
@@ -0,0 +1,107 @@
+"""Batched state changes for a device, sent to the API server in a single request"""
+from contextvars import ContextVar
+from datetime import datetime
+import logging
+from typing import TYPE_CHECKING, Any, Optional
+
+from hubspaceng.deadline import with_deadline
+from hubspaceng.errors import DeadlineExceededError, RequestError
+from hubspaceng.scheduler import Priority
+from hubspaceng.util import get_utc_time, index_state_values
+
+if TYPE_CHECKING:
+    from hubspaceng.models.devices.base import BaseDevice
+    from hubspaceng.models.functions.base import BaseFunction
+
+_LOGGER = logging.getLogger(__name__)
+
+# Batches open in the current task, keyed by device id
+_ACTIVE_BATCHES: ContextVar[Optional[dict]] = ContextVar("hubspace_active_batches", default=None)
+
+def get_active_batch(device: "BaseDevice") -> Optional["DeviceBatch"]:
+    """Return the batch collecting changes for a device in the current task, if any"""
+    active_batches = _ACTIVE_BATCHES.get()
+    if active_batches is None:
+        return None
+    return active_batches.get(device.id)
+
+class DeviceBatch:
+    """Collects state changes for the functions of a device and sends them in one request
+
+    Used as an async context manager, set_state calls made on the device's functions in the
+    current task are collected instead of sent, and committed when the block exits cleanly.
+    The last value set for a function wins.
+    """
+
+    def __init__(self, device: "BaseDevice", priority: Priority = Priority.INTERACTIVE):
+        self.device = device
+        self.priority = priority
+        self._values = {}  # type: dict
+        self._context_token = None
+
+    @property
+    def pending(self) -> dict:
+        """Return the serialized values waiting to be sent, keyed by function"""
+        return {function: value for function, value in self._values.values()}
+
+    def add(self, function: "BaseFunction", serialized_value: Any):
+        """Add an already validated and serialized value for a function to the batch"""
+        if function.device is not self.device:
+            raise ValueError(f"Function {function.id} does not belong to device {self.device.id}")
+        self._values[function.state_key] = (function, serialized_value)
+
+    def set_state(self, function: "BaseFunction", new_value: Any):
+        """Validate a new value for a function and add it to the batch"""
+        if not function.validate_state(new_value):
+            raise ValueError(f"{new_value} is not a valid state for {function.title} ({function.id})")
+        self.add(function, function.get_serializable_state(new_value))
+
+    async def commit(self, timeout: Optional[float] = None) -> Optional[dict]:
+        """Send every collected value in a single request and apply the response to the device
+
+        Functions the response leaves out take the value that was sent. Must finish within
+        timeout seconds, defaulting to `API.timeouts.set_state`, or DeadlineExceededError is raised.
+        """
+        if not self._values:
+            return None
+        values = list(self._values.values())
+        self._values = {}
+
+        utc_time = get_utc_time()
+        state_values = [function.build_state_value(value, utc_time) for function, value in values]
+        _LOGGER.debug("Sending %s batched values for device %s", len(state_values), self.device.id)
+        api = self.device.api
+        try:
+            set_resp = await with_deadline(
+                self.device._put_state_values(state_values, priority=self.priority),  # pylint: disable=protected-access
+                api.timeouts.set_state if timeout is None else timeout,
+                f"Setting batched values for device {self.device.id}",
+            )
+        except DeadlineExceededError:
+            raise
+        except Exception as ex:
+            raise RequestError(f"Could not set batched device values for {self.device.id}") from ex
+
+        echoed = list(set_resp.get('values') or []) if set_resp else []
+        echoed_keys = index_state_values(echoed)
+        for function, value in values:
+            if function.state_key not in echoed_keys:
+                _LOGGER.debug("No state for %s (%s) in batch response; assuming %s", function.title, function.id, value)
+                echoed.append(function.build_state_value(value, utc_time))
+        changes = self.device.hydrate({"values": echoed}, datetime.utcnow())
+        await api.events.publish(changes)
+        return set_resp
+
+    async def __aenter__(self) -> "DeviceBatch":
+        active_batches = dict(_ACTIVE_BATCHES.get() or {})
+        active_batches[self.device.id] = self
+        self._context_token = _ACTIVE_BATCHES.set(active_batches)
+        return self
+
+    async def __aexit__(self, exc_type, exc, traceback) -> None:
+        _ACTIVE_BATCHES.reset(self._context_token)
+        self._context_token = None
+        if exc_type is None:
+            await self.commit()
+        else:
+            self._values = {}
@@ -1,14 +1,30 @@
 """A device implementation for devices with subdevices, like CeilingFan + Light"""
+import datetime
+
 from hubspaceng.models.devices.base import BaseDevice
 
 class ComboDevice(BaseDevice):
     """A device implementation for devices with subdevices, like CeilingFan + Light"""
-    _children: dict[BaseDevice] = dict()
+    _children: dict[BaseDevice]
+
+    def __init__(
+            self,
+            device_json: dict,
+            account: "HubspaceAccount",
+            state_update: datetime,
+            function_index: "FunctionIndex" = None,
+        ):
+        super().__init__(device_json, account, state_update, function_index)
+        self._children = dict()
 
     def add_child(self, child: BaseDevice):
         """Add a child device for this ComboDevice"""
         self._children[child.id] = child
 
+    def remove_child(self, child_id: str):
+        """Remove a child device from this ComboDevice"""
+        self._children.pop(child_id, None)
+
     @property
     def children(self) -> dict[BaseDevice]:
         """Return the list of child devices"""
@@ -15,8 +15,9 @@ class RGBLightDevice(BaseLightDevice):
             device_json: dict,
             account: "HubspaceAccount",
             state_update: datetime,
+            function_index: "FunctionIndex" = None,
         ):
-        super().__init__(device_json, account, state_update)
+        super().__init__(device_json, account, state_update, function_index)
 
         # Look for a color-mode function
         color_mode_func_def = self.filter_function_def("color-mode", "category")
@@ -13,8 +13,9 @@ class TunableLightDevice(BaseLightDevice):
             device_json: dict,
             account: "HubspaceAccount",
             state_update: datetime,
+            function_index: "FunctionIndex" = None,
         ):
-        super().__init__(device_json, account, state_update)
+        super().__init__(device_json, account, state_update, function_index)
 
         # Look for a color-temp function
         color_temp_func_def = self.filter_function_def("color-temperature", "category")
@@ -15,8 +15,9 @@ class LockDevice(BaseDevice):
             device_json: dict,
             account: "HubspaceAccount",
             state_update: datetime,
+            function_index: "FunctionIndex" = None,
         ):
-        super().__init__(device_json, account, state_update)
+        super().__init__(device_json, account, state_update, function_index)
 
         # Find the lock function
         lock_func_def = self.filter_function_def("lock-control", "category")
@@ -27,7 +28,7 @@ class LockDevice(BaseDevice):
         # Find the battery level function
         battery_level_func_def = self.filter_function_def("battery-level", "numeric")
         if battery_level_func_def is not None:
-            self.battery_level_func = CategoryFunction("Battery Level", self, battery_level_func_def)
+            self.battery_level_func = RangeFunction("Battery Level", self, battery_level_func_def)
             self._functions.append(self.battery_level_func)
 
     async def lock(self):
@@ -15,8 +15,9 @@ class PlugDevice(BaseDevice):
             device_json: dict,
             account: "HubspaceAccount",
             state_update: datetime,
+            function_index: "FunctionIndex" = None,
         ):
-        super().__init__(device_json, account, state_update)
+        super().__init__(device_json, account, state_update, function_index)
 
         # Find the power function
         power_func_def = self.filter_function_def("power", "category")
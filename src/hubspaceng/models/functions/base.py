@@ -1,17 +1,22 @@
 """Basic implementation of a configurable device function"""
-from typing import TYPE_CHECKING, Any, Optional
-
-from hubspaceng.const import (
-    METADATA_API_CALLING_HOST,
-    METADATA_API_HOST,
-    USER_AGENT
-)
-from hubspaceng.errors import RequestError
-from hubspaceng.util import get_utc_time
+import asyncio
+from datetime import datetime
+import logging
+from typing import TYPE_CHECKING, Any, Callable, Optional, Set
+
+from hubspaceng.changes import StateChange
+from hubspaceng.const import DEFAULT_COALESCE_WINDOW
+from hubspaceng.deadline import with_deadline
+from hubspaceng.errors import DeadlineExceededError, RequestError
+from hubspaceng.models.functions.coalesce import WriteCoalescer
+from hubspaceng.scheduler import Priority
+from hubspaceng.util import get_utc_time, index_state_values
 if TYPE_CHECKING:
     from hubspaceng.account import HubspaceAccount
     from hubspaceng.models.devices import BaseDevice
 
+_LOGGER = logging.getLogger(__name__)
+
 class BaseFunction:
     """Basic implementation of a configurable device function"""
     _id: str
@@ -22,6 +27,8 @@ class BaseFunction:
     func_instance: Optional[str]
     func_type: str
     _value: Any = None
+    _coalescer: Optional[WriteCoalescer]
+    _pending: bool = False
 
     def __init__(self,
         title: str,
@@ -34,6 +41,29 @@ class BaseFunction:
         self.func_instance = raw_fragment.get('functionInstance')
         self.func_type = raw_fragment.get('type')
         self.raw_fragment = raw_fragment
+        self._coalescer = None
+        self._pending_value = None
+        self._pending_since = None
+        self._pending_write_id = 0
+        # Held so in-flight optimistic writes are not only weakly referenced by the loop
+        self._pending_writes = set()  # type: Set[asyncio.Task]
+        self._rollback_value = None
+        self._rollback_callbacks = []
+
+    def enable_coalescing(self, window: float = DEFAULT_COALESCE_WINDOW):
+        """Collapse state changes made within `window` seconds of each other into one request"""
+        self._coalescer = WriteCoalescer(self, window)
+
+    def disable_coalescing(self):
+        """Send every state change as its own request; changes still waiting to be coalesced are dropped"""
+        if self._coalescer is not None:
+            self._coalescer.cancel()
+        self._coalescer = None
+
+    @property
+    def coalescing(self) -> bool:
+        """Return whether state changes for this function are coalesced"""
+        return self._coalescer is not None
 
     @property
     def api(self) -> "API":
@@ -45,31 +75,185 @@ class BaseFunction:
         """Return the function ID"""
         return self._id
 
+    @property
+    def state_key(self) -> tuple:
+        """Return the (functionClass, functionInstance) key used to match this function in state documents"""
+        return (self.func_class, self.func_instance)
+
     def get_state(self) -> Any:
         """Return the value for this device function"""
         return self._value
 
-    async def set_state(self, new_value: Any):
-        """Change the state for this function via the API server"""
+    @property
+    def pending(self) -> bool:
+        """Return whether the current value is optimistic and not yet confirmed by the API server"""
+        return self._pending
+
+    def on_rollback(self, callback: Callable[["BaseFunction", Any, Any], None]) -> Callable[[], None]:
+        """Register a callback, called with (function, attempted value, restored value) when an
+        optimistic change is rolled back; returns a function that removes the callback"""
+        self._rollback_callbacks.append(callback)
+
+        def remove():
+            if callback in self._rollback_callbacks:
+                self._rollback_callbacks.remove(callback)
+        return remove
+
+    async def set_state(
+        self,
+        new_value: Any,
+        priority: Priority = Priority.INTERACTIVE,
+        optimistic: Optional[bool] = None,
+        timeout: Optional[float] = None,
+    ):
+        """Change the state for this function via the API server
+
+        Inside a `BaseDevice.batch()` block, the change is collected and sent with the batch instead.
+        With coalescing enabled, rapid changes are collapsed and every caller receives the final state.
+        With optimistic updates (defaulting to `API.optimistic_updates`), the local value changes and
+        this returns immediately; the change is confirmed or rolled back when the server responds.
+        The change must be sent within timeout seconds, defaulting to `API.timeouts.set_state`,
+        or DeadlineExceededError is raised (or, if optimistic, the change is rolled back).
+        """
         if not self.validate_state(new_value):
             raise ValueError(f"{new_value} is not a valid state for {self.title} ({self.id})")
+        batch = self.device.active_batch
+        if batch is not None:
+            batch.add(self, self.get_serializable_state(new_value))
+            return None
+        if optimistic is None:
+            optimistic = self.api.optimistic_updates
+        if timeout is None:
+            timeout = self.api.timeouts.set_state
         try:
-            new_value = self.get_serializable_state(new_value)
-            await self._set_remote_state(new_value)
-            self._value = new_value
+            serialized_value = self.get_serializable_state(new_value)
+            if optimistic:
+                # Show the value as the server will echo it, so confirmations compare equal
+                attempted = self.parse_state(serialized_value)
+                old_value = self._value
+                write_id = self._begin_optimistic(attempted)
+                await self._publish_change(old_value, attempted)
+                task = asyncio.create_task(
+                    self._settle_optimistic(write_id, attempted, serialized_value, priority, timeout)
+                )
+                self._pending_writes.add(task)
+                task.add_done_callback(self._pending_writes.discard)
+                return attempted
+            confirmed = await with_deadline(
+                self._send_state(serialized_value, priority), timeout, f"Setting {self.title} ({self.id})"
+            )
+            old_value = self._value
+            self._value = confirmed
+            await self._publish_change(old_value, confirmed)
+            return confirmed
+        except DeadlineExceededError:
+            raise
         except Exception as ex:
             raise RequestError(f"Could not set device value for {self.id}") from ex
 
-    async def update(self):
-        """Update the value for this function from the API server"""
+    async def _send_state(self, serialized_value: Any, priority: Priority) -> Any:
+        if self._coalescer is not None:
+            return await self._coalescer.submit(serialized_value, priority=priority)
+        return await self._set_remote_state(serialized_value, priority=priority)
+
+    def _begin_optimistic(self, new_value: Any) -> int:
+        if not self._pending:
+            self._rollback_value = self._value
+        self._pending = True
+        self._pending_value = new_value
+        self._pending_since = get_utc_time()
+        self._pending_write_id += 1
+        self._value = new_value
+        return self._pending_write_id
+
+    async def _settle_optimistic(
+        self, write_id: int, attempted: Any, serialized_value: Any, priority: Priority, timeout: Optional[float]
+    ):
+        try:
+            confirmed = await with_deadline(
+                self._send_state(serialized_value, priority), timeout, f"Setting {self.title} ({self.id})"
+            )
+        except Exception as ex:  # pylint: disable=broad-except
+            _LOGGER.warning("Optimistic change of %s (%s) failed: %s", self.title, self.id, ex)
+            if self._pending and write_id == self._pending_write_id:
+                self._rollback(attempted, self._rollback_value)
+                await self._publish_change(attempted, self._rollback_value)
+            return
+
+        if not self._pending:
+            # Already settled by a poll
+            return
+        if write_id == self._pending_write_id:
+            self._pending = False
+            if confirmed != attempted:
+                self._rollback(attempted, confirmed)
+                await self._publish_change(attempted, confirmed)
+        else:
+            # A newer optimistic change is still in flight; keep showing it, and roll back
+            # to this confirmed value if it fails
+            self._rollback_value = confirmed
+
+    def _make_change(self, old_value: Any, new_value: Any) -> StateChange:
+        return StateChange(
+            self.device.id, self.func_class, self.func_instance, old_value, new_value, datetime.utcnow()
+        )
+
+    async def _publish_change(self, old_value: Any, new_value: Any):
+        if old_value != new_value:
+            await self.api.events.publish([self._make_change(old_value, new_value)])
+
+    def _rollback(self, attempted: Any, restored: Any):
+        _LOGGER.debug("Rolling back %s (%s) from %s to %s", self.title, self.id, attempted, restored)
+        self._pending = False
+        self._value = restored
+        for callback in list(self._rollback_callbacks):
+            try:
+                callback(self, attempted, restored)
+            except Exception:  # pylint: disable=broad-except
+                _LOGGER.exception("Error in rollback callback for %s (%s)", self.title, self.id)
+
+    async def update(self, timeout: Optional[float] = None):
+        """Update the value for this function from the API server
+
+        Must finish within timeout seconds, defaulting to `API.timeouts.update`, or
+        DeadlineExceededError is raised.
+        """
+        old_value = self._value
         try:
-            new_value = await self._get_remote_state()
-            new_value = self.parse_state(new_value)
-            if not self.validate_state(new_value):
-                raise ValueError(f"{new_value} is not a valid state for {self.title} ({self.id})")
-            self._value = new_value
+            new_value = await with_deadline(
+                self._get_remote_state(),
+                self.api.timeouts.update if timeout is None else timeout,
+                f"Updating {self.title} ({self.id})",
+            )
+            self.apply_state(new_value)
+        except DeadlineExceededError:
+            raise
         except Exception as ex:
             raise RequestError(f"Could not update device {self.id}") from ex
+        await self._publish_change(old_value, self._value)
+
+    def apply_state(self, raw_value: Any, update_time: Optional[int] = None):
+        """Update the value for this function from a raw value already retrieved from the API server
+
+        While an optimistic change is pending, a matching value confirms it, a different value
+        with an update time after the change rolls it back, and older values are ignored.
+        """
+        new_value = self.parse_state(raw_value)
+        if not self.validate_state(new_value):
+            raise ValueError(f"{new_value} is not a valid state for {self.title} ({self.id})")
+        if self._pending:
+            if new_value == self._pending_value:
+                self._pending = False
+            elif update_time is not None and update_time > self._pending_since:
+                self._rollback(self._pending_value, new_value)
+            else:
+                # The server may not have applied the change yet; the write settles it either way
+                _LOGGER.debug(
+                    "Ignoring %s for %s (%s) while a change to %s is pending",
+                    new_value, self.title, self.id, self._pending_value,
+                )
+            return
+        self._value = new_value
 
     def validate_state(self, new_value: Any) -> bool:
         """Validate a new value for this function, either from the server or from client code"""
@@ -84,65 +268,48 @@ class BaseFunction:
         return new_value
 
     def _get_device_url(self) -> str:
-        return f"https://{METADATA_API_HOST}/v1/accounts/{self.device.account.id}/metadevices/{self.device.id}/state"
+        return self.device._get_state_url()  # pylint: disable=protected-access
+
+    def _find_state_value(self, state_doc: Optional[dict], sent_value: Any = None) -> Any:
+        """Return this function's value from a state document
+
+        For the echo of a PUT, pass the value that was sent; it is returned when the echo omits
+        this function. Otherwise a missing value raises ValueError.
+        """
+        state_value = index_state_values(state_doc.get('values') if state_doc else None).get(self.state_key)
+        if state_value is None:
+            if sent_value is not None:
+                _LOGGER.debug("No state for %s (%s) in response; assuming %s", self.title, self.id, sent_value)
+                return sent_value
+            raise ValueError(f"No state for {self.title} ({self.id}) in response for device {self.device.id}")
+        return state_value.get('value')
 
     async def _get_remote_state(self) -> Any:
-        _, state_resp = await self.api.request(
-            method="get",
-            returns="json",
-            url=self._get_device_url(),
-            headers = {
-                "user-agent": USER_AGENT,
-                "Accept": "application/json",
-                "accept-encoding": "gzip",
-                "host": METADATA_API_CALLING_HOST
-            }
-        )
+        state_resp = await self.device._get_remote_state_doc()  # pylint: disable=protected-access
+        return self._find_state_value(state_resp)
 
-        for lis in state_resp.get('values'):
-            for key,val in lis.items():
-                if key == 'functionClass' and val == self.func_class:
-                    state = lis.get('value')
-
-        return state
-
-    async def _set_remote_state(self, state) -> Any:
-        utc_time = get_utc_time()
-        payload = {
-            "metadeviceId": str(self.device.id),
-            "values": [
-                {
-                    "functionClass": self.func_class,
-                    "lastUpdateTime": utc_time,
-                    "value": state
-                }
-            ]
+    def build_state_value(self, state: Any, utc_time: int) -> dict:
+        """Build the entry for this function in the values list of a state update"""
+        state_value = {
+            "functionClass": self.func_class,
+            "lastUpdateTime": utc_time,
+            "value": state
         }
-
         if self.func_instance is not None:
-            payload["values"][0]["functionInstance"] = self.func_instance
-
-        _, set_resp = await self.api.request(
-            method="PUT",
-            returns="json",
-            url=self._get_device_url(),
-            headers = {
-                "user-agent": USER_AGENT,
-                "host": METADATA_API_CALLING_HOST,
-                "accept-encoding": "gzip",
-                "content-type": "application/json; charset=utf-8",
-            },
-            json = payload
-        )
+            state_value["functionInstance"] = self.func_instance
+        return state_value
 
-        for lis in set_resp.get('values'):
-            for key,val in lis.items():
-                if key == 'functionClass' and val == self.func_class:
-                    state = lis.get('value')
+    async def _set_remote_state(self, state, priority: Priority = Priority.INTERACTIVE) -> Any:
+        """Send a serialized value and return the parsed value the server echoes
 
+        The local value is left alone; the caller applies the result, so an older optimistic
+        write confirmed after a newer one never shows through.
+        """
+        state_value = self.build_state_value(state, get_utc_time())
+        set_resp = await self.device._put_state_values([state_value], priority=priority)  # pylint: disable=protected-access
+
+        state = self._find_state_value(set_resp, sent_value=state)
         new_state = self.parse_state(state)
         if not self.validate_state(new_state):
             raise ValueError(f"{state} is not a valid state for {self.title} ({self.id})")
-        self._value = new_state
-
         return new_state
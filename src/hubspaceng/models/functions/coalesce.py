@@ -0,0 +1,96 @@
+"""Coalescing of rapid state changes for a single function"""
+import asyncio
+import logging
+from typing import TYPE_CHECKING, Any, Optional, Set
+
+from hubspaceng.deadline import clear_deadline, with_deadline
+from hubspaceng.errors import RequestError
+from hubspaceng.scheduler import Priority
+
+if TYPE_CHECKING:
+    from hubspaceng.models.functions.base import BaseFunction
+
+_LOGGER = logging.getLogger(__name__)
+
+class WriteCoalescer:
+    """Collapses bursts of state changes for a function into a single request
+
+    Values submitted within `window` seconds of the first pending value replace each other
+    (last writer wins); when the window closes only the latest value is sent, and every
+    caller in the window receives the result of that request. Writes for a function are
+    sent one at a time, so values arriving while a request is in flight join the next one.
+    """
+
+    def __init__(self, function: "BaseFunction", window: float):
+        self.function = function
+        self.window = window
+        self._pending_value = None  # type: Any
+        self._pending_priority = None  # type: Optional[Priority]
+        self._future = None  # type: Optional[asyncio.Future]
+        self._write_lock = asyncio.Lock()
+        # Held so the loop's weak references are not the only ones; a new window can open
+        # while the previous one is still being written
+        self._flush_tasks = set()  # type: Set[asyncio.Task]
+
+    @property
+    def pending(self) -> bool:
+        """Return whether a value is waiting to be sent"""
+        return self._future is not None
+
+    async def submit(self, serialized_value: Any, priority: Priority = Priority.INTERACTIVE) -> Any:
+        """Queue a serialized value to be sent, and wait for the result of the request that sends it"""
+        self._pending_value = serialized_value
+        if self._pending_priority is None or priority < self._pending_priority:
+            self._pending_priority = priority
+        if self._future is None:
+            future = self._future = asyncio.get_running_loop().create_future()
+            task = asyncio.create_task(self._flush_after_window(future))
+            self._flush_tasks.add(task)
+            task.add_done_callback(lambda task: self._flush_done(task, future))
+        else:
+            _LOGGER.debug("Coalescing write for %s (%s)", self.function.title, self.function.id)
+        return await asyncio.shield(self._future)
+
+    def cancel(self) -> None:
+        """Drop any value not yet sent; callers waiting for it get RequestError"""
+        future = self._future
+        self._future = None
+        self._pending_value = None
+        self._pending_priority = None
+        if future is not None and not future.done():
+            future.set_exception(
+                RequestError(f"Coalesced change for {self.function.title} was cancelled before it was sent")
+            )
+        for task in list(self._flush_tasks):
+            task.cancel()
+
+    def _flush_done(self, task: asyncio.Task, future: asyncio.Future) -> None:
+        self._flush_tasks.discard(task)
+        if not future.done():
+            # The flush was cancelled, e.g. as the loop shut down; don't leave callers waiting
+            future.cancel()
+
+    async def _flush_after_window(self, future: asyncio.Future) -> None:
+        # The write is shared by every caller in the window, so it must not inherit the
+        # deadline of whichever one opened it
+        clear_deadline()
+        await asyncio.sleep(self.window)
+        async with self._write_lock:
+            if future is not self._future:
+                # Cancelled while the window was open
+                return
+            # Take whatever is latest now; later submissions start a new window
+            value, priority = self._pending_value, self._pending_priority
+            self._future = None
+            self._pending_value = None
+            self._pending_priority = None
+            try:
+                result = await with_deadline(
+                    self.function._set_remote_state(value, priority=priority),  # pylint: disable=protected-access
+                    self.function.api.timeouts.set_state,
+                    f"Setting {self.function.title} ({self.function.id})",
+                )
+            except Exception as ex:  # pylint: disable=broad-except
+                future.set_exception(ex)
+            else:
+                future.set_result(result)
@@ -0,0 +1,121 @@
+"""Commands that fan out to every device in a group, like a Room, Home or Account"""
+import asyncio
+from dataclasses import dataclass
+import logging
+from typing import Any, Awaitable, Callable, Iterable, Optional
+
+from hubspaceng.const import DEFAULT_GROUP_CONCURRENCY
+from hubspaceng.models.devices.base import BaseDevice
+from hubspaceng.models.devices.combo import ComboDevice
+
+_LOGGER = logging.getLogger(__name__)
+
+@dataclass
+class GroupResult:
+    """The outcome of a group command for a single device"""
+    device: BaseDevice
+    result: Any = None
+    error: Optional[BaseException] = None
+
+    @property
+    def ok(self) -> bool:
+        """Return whether the command succeeded for this device"""
+        return self.error is None
+
+class GroupCommandsMixin:
+    """Commands that fan out concurrently to every device in a group, descending into ComboDevices"""
+
+    def _group_members(self) -> Iterable[BaseDevice]:
+        """Return the devices directly in this group"""
+        raise NotImplementedError()
+
+    def group_devices(self) -> list[BaseDevice]:
+        """Return every device in this group, with ComboDevices replaced by their children"""
+        devices = {}
+        pending = list(self._group_members())
+        while pending:
+            device = pending.pop(0)
+            if isinstance(device, ComboDevice):
+                pending.extend(device.children.values())
+            elif device.id not in devices:
+                devices[device.id] = device
+        return list(devices.values())
+
+    async def run_group_command(
+        self,
+        command: Callable[[BaseDevice], Awaitable[Any]],
+        devices: Optional[Iterable[BaseDevice]] = None,
+        max_concurrency: int = DEFAULT_GROUP_CONCURRENCY,
+        stagger: float = 0,
+    ) -> dict[str, GroupResult]:
+        """Run a command against every device concurrently and return the result for each device id
+
+        Args:
+            command: coroutine function called with each device
+            devices: the devices to target; defaults to every device in the group
+            max_concurrency: the most commands in flight at once
+            stagger: seconds to wait between starting each command, to spread out requests
+        """
+        if devices is None:
+            devices = self.group_devices()
+        devices = list(devices)
+        semaphore = asyncio.Semaphore(max(1, max_concurrency))
+
+        async def run(index: int, device: BaseDevice) -> GroupResult:
+            if stagger > 0:
+                await asyncio.sleep(index * stagger)
+            async with semaphore:
+                try:
+                    return GroupResult(device, result=await command(device))
+                except Exception as ex:  # pylint: disable=broad-except
+                    _LOGGER.debug("Group command failed for device %s: %s", device.id, ex)
+                    return GroupResult(device, error=ex)
+
+        results = await asyncio.gather(*[run(index, device) for index, device in enumerate(devices)])
+        return {result.device.id: result for result in results}
+
+    async def turn_on(self, **kwargs) -> dict[str, GroupResult]:
+        """Turn on every device in the group with a power function"""
+        return await self.set_function_state("power", "on", **kwargs)
+
+    async def turn_off(self, **kwargs) -> dict[str, GroupResult]:
+        """Turn off every device in the group with a power function"""
+        return await self.set_function_state("power", "off", **kwargs)
+
+    async def set_brightness(self, new_brightness: int, **kwargs) -> dict[str, GroupResult]:
+        """Change the brightness of every device in the group with a brightness function"""
+        return await self.set_function_state("brightness", new_brightness, **kwargs)
+
+    async def set_function_state(
+        self,
+        function_class: str,
+        new_value: Any,
+        function_instance: Optional[str] = None,
+        **kwargs
+    ) -> dict[str, GroupResult]:
+        """Set a function, by functionClass and optionally functionInstance, on every device that has it
+
+        Devices with several matching functions set them all in a single batch. Keyword
+        arguments are passed to run_group_command.
+        """
+        def matching_functions(device: BaseDevice):
+            return [
+                function for function in device.functions
+                if function.func_class == function_class
+                and (function_instance is None or function.func_instance == function_instance)
+            ]
+
+        async def command(device: BaseDevice):
+            functions = matching_functions(device)
+            if len(functions) == 1:
+                return await functions[0].set_state(new_value)
+            async with device.batch():
+                for function in functions:
+                    await function.set_state(new_value)
+            return None
+
+        devices = kwargs.pop("devices", None)
+        if devices is None:
+            devices = self.group_devices()
+        devices = [device for device in devices if matching_functions(device)]
+        return await self.run_group_command(command, devices=devices, **kwargs)
@@ -21,10 +21,18 @@ class Home(Place):
         super().__init__(device_json, account, state_update)
         self._rooms = dict()
 
+    def _group_members(self):
+        for room in self._rooms.values():
+            yield from room.devices.values()
+
     def add_room(self, room: Room):
         """Add a room to this home"""
         self._rooms[room.id] = room
 
+    def remove_room(self, room_id: str):
+        """Remove a room from this home"""
+        self._rooms.pop(room_id, None)
+
     def get_unlinked_children(self):
         """Return a list of children that are in the JSON, but no object is linked"""
         all_children = self._device_json['children']
@@ -2,10 +2,12 @@
 import datetime
 from typing import TYPE_CHECKING, Optional
 
+from hubspaceng.models.group import GroupCommandsMixin
+
 if TYPE_CHECKING:
     from hubspaceng.account import HubspaceAccount
 
-class Place:
+class Place(GroupCommandsMixin):
     """Basic implementation of a place, parent class of Home and Room"""
     _id: str
     _name: str
@@ -24,6 +26,22 @@ class Place:
         self._account = account
         self.state_update = state_update
 
+    def update_json(self, device_json: dict, state_update: datetime):
+        """Replace the place JSON with a fresh copy from the API server"""
+        self._name = device_json['friendlyName']
+        self._device_json = device_json
+        self.state_update = state_update
+
+    @property
+    def device_json(self) -> dict:
+        """Return the metadevice JSON for this Place"""
+        return self._device_json
+
+    @property
+    def child_ids(self) -> list[str]:
+        """Return the ids of the children listed in the JSON for this Place"""
+        return self._device_json['children']
+
     @property
     def id(self) -> str:
         """Return the ID for this Place"""
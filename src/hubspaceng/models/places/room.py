@@ -22,10 +22,17 @@ class Room(Place):
         super().__init__(device_json, account, state_update)
         self._devices = dict()
 
+    def _group_members(self):
+        return self._devices.values()
+
     def add_device(self, device: BaseDevice):
         """Add a device to this room"""
         self._devices[device.id] = device
 
+    def remove_device(self, device_id: str):
+        """Remove a device from this room"""
+        self._devices.pop(device_id, None)
+
     def get_unlinked_children(self) -> list[str]:
         """Return a list of children that are in the JSON, but no object is linked"""
         all_children = self._device_json['children']
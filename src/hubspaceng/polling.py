@@ -0,0 +1,198 @@
+"""Adaptive per-device polling for the Hubspace API"""
+import asyncio
+from datetime import datetime
+import logging
+import time
+from typing import TYPE_CHECKING, Dict, Optional
+
+from hubspaceng.const import (
+    DEFAULT_POLL_BACKOFF,
+    DEFAULT_POLL_DEVICE_LIST_INTERVAL,
+    DEFAULT_POLL_MAX_INTERVAL,
+    DEFAULT_POLL_MIN_INTERVAL,
+    DEFAULT_POLL_REQUEST_BUDGET
+)
+from hubspaceng.errors import HubspaceError
+from hubspaceng.models.devices.base import BaseDevice
+from hubspaceng.scheduler import Priority, TokenBucket
+
+if TYPE_CHECKING:
+    from hubspaceng.api import API
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class DevicePollState:
+    """Polling bookkeeping for a single device"""
+
+    def __init__(self, interval: float, next_due: float) -> None:
+        self.interval = interval
+        self.next_due = next_due
+        self.last_polled = None  # type: Optional[datetime]
+        self.last_changed = None  # type: Optional[datetime]
+        self.polls = 0
+        self.changes = 0
+
+    @property
+    def change_rate(self) -> float:
+        """Return the fraction of polls that found a change"""
+        return self.changes / self.polls if self.polls else 0.0
+
+
+class AdaptivePoller:  # pylint: disable=too-many-instance-attributes
+    """Poll each device on its own interval, based on how often its state actually changes
+
+    A device whose state changed, or which was just written to, is polled again after
+    `min_interval`; each poll that finds no change multiplies its interval by `backoff`,
+    up to `max_interval`. Polls are spent from a budget of `request_budget` requests per
+    minute, and the device list is refreshed every `device_list_interval` seconds.
+    """
+
+    def __init__(
+        self,
+        api: "API",
+        min_interval: float = DEFAULT_POLL_MIN_INTERVAL,
+        max_interval: float = DEFAULT_POLL_MAX_INTERVAL,
+        backoff: float = DEFAULT_POLL_BACKOFF,
+        request_budget: int = DEFAULT_POLL_REQUEST_BUDGET,
+        device_list_interval: float = DEFAULT_POLL_DEVICE_LIST_INTERVAL,
+    ) -> None:
+        if min_interval <= 0 or max_interval < min_interval:
+            raise ValueError("Poll intervals must be positive with max_interval >= min_interval")
+        self._api = api
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.device_list_interval = device_list_interval
+        self._budget = TokenBucket(request_budget / 60, max(1, request_budget // 6))
+        self._states = {}  # type: Dict[str, DevicePollState]
+        self._next_device_list_update = time.monotonic()
+        self._task = None  # type: Optional[asyncio.Task]
+
+    @property
+    def states(self) -> Dict[str, DevicePollState]:
+        """Return the polling state for each tracked device, by device id"""
+        return self._states
+
+    @property
+    def running(self) -> bool:
+        """Return whether the polling loop is running"""
+        return self._task is not None and not self._task.done()
+
+    def _record(self, device: BaseDevice, changed: bool) -> None:
+        state = self._states.get(device.id)
+        if state is None:
+            state = self._states[device.id] = DevicePollState(self.min_interval, 0)
+        state.polls += 1
+        state.last_polled = datetime.utcnow()
+        if changed:
+            state.changes += 1
+            state.last_changed = state.last_polled
+            state.interval = self.min_interval
+        else:
+            state.interval = min(self.max_interval, state.interval * self.backoff)
+        state.next_due = time.monotonic() + state.interval
+
+    def _was_written(self, device: BaseDevice, state: DevicePollState) -> bool:
+        return device.last_state_write is not None and (
+            state.last_polled is None or device.last_state_write > state.last_polled
+        )
+
+    async def _update_device_list(self) -> None:
+        """Refresh accounts and devices, which also hydrates every device's state"""
+        changed_ids = set()
+        fetched_accounts = set()
+        for account_id, result in (await self._api.update_accounts()).items():
+            if result.ok and not result.changes.throttled:
+                fetched_accounts.add(account_id)
+                changed_ids.update(change.device_id for change in result.changes.states)
+        devices = self._api.devices
+        for device_id, device in devices.items():
+            if device.account.id not in fetched_accounts:
+                # Throttled or failed, so not fetched; that says nothing about whether it changed
+                continue
+            self._record(device, device_id in changed_ids)
+        for removed_id in [i for i in self._states if i not in devices]:
+            del self._states[removed_id]
+        self._next_device_list_update = time.monotonic() + self.device_list_interval
+
+    async def poll_once(self) -> int:
+        """Poll the device list and any devices that are due, within budget; return devices polled"""
+        started = time.monotonic()
+        try:
+            return await self._poll_once(started)
+        finally:
+            self._api.metrics.observe_poll_cycle(time.monotonic() - started)
+
+    async def _poll_once(self, now: float) -> int:
+        if now >= self._next_device_list_update and self._budget.delay() == 0:
+            # One request for the user, plus one per account
+            for _ in range(1 + len(self._api.accounts)):
+                self._budget.consume()
+            await self._update_device_list()
+            return len(self._api.devices)
+
+        due = []
+        for device_id, device in self._api.devices.items():
+            state = self._states.get(device_id)
+            if state is None:
+                state = self._states[device_id] = DevicePollState(self.min_interval, now)
+            if self._was_written(device, state):
+                # Confirm recent writes soon
+                state.interval = self.min_interval
+                state.next_due = min(state.next_due, now + self.min_interval)
+            if state.next_due <= now:
+                due.append((state.next_due, device))
+        due.sort(key=lambda entry: entry[0])
+
+        polled = 0
+        for _, device in due:
+            if self._budget.delay() > 0:
+                _LOGGER.debug("Poll budget exhausted, deferring %s devices", len(due) - polled)
+                break
+            self._budget.consume()
+            try:
+                changes = await device.refresh(priority=Priority.BACKGROUND)
+            except HubspaceError as err:
+                _LOGGER.debug("Polling device %s failed: %s", device.id, err)
+                self._record(device, False)
+                continue
+            self._record(device, len(changes) > 0)
+            polled += 1
+        return polled
+
+    def next_wakeup(self) -> float:
+        """Return the seconds until the poller should next check for due devices"""
+        next_due = min(
+            [self._next_device_list_update] + [state.next_due for state in self._states.values()]
+        )
+        # Wake at least every min_interval so recently written devices are noticed
+        wait = min(next_due - time.monotonic(), self.min_interval)
+        return max(wait, self._budget.delay(), 0.1)
+
+    async def run(self) -> None:
+        """Poll until cancelled"""
+        while True:
+            try:
+                await self.poll_once()
+            except HubspaceError as err:
+                _LOGGER.warning("Polling failed: %s", err)
+                self._next_device_list_update = time.monotonic() + self.min_interval
+            await asyncio.sleep(self.next_wakeup())
+
+    def start(self) -> asyncio.Task:
+        """Start polling in a background task"""
+        if not self.running:
+            self._task = asyncio.create_task(self.run(), name="Hubspace_Poller")
+        return self._task
+
+    async def stop(self) -> None:
+        """Stop polling and wait for the background task to finish"""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
@@ -0,0 +1,239 @@
+"""Record real Hubspace traffic to JSONL, with secrets and ids redacted, and replay it offline"""
+import asyncio
+from collections import defaultdict, deque
+from datetime import datetime
+import json
+import logging
+import re
+import time
+from typing import Any, Deque, Dict, Optional, Tuple
+import uuid
+
+from aiohttp import ClientResponse, ClientSession, RequestInfo
+from aiohttp.client_exceptions import ClientConnectionError, ClientResponseError
+from multidict import CIMultiDict, CIMultiDictProxy
+from yarl import URL
+
+from hubspaceng.request import Transport
+
+_LOGGER = logging.getLogger(__name__)
+
+REDACTED = "REDACTED"
+
+# Keys whose values are secrets wherever they appear: bodies, form data, query strings
+SENSITIVE_KEYS = frozenset({
+    "access_token", "code", "code_verifier", "credentialId", "execution", "id_token", "password",
+    "refresh_token", "session_code", "session_state", "tab_id", "token", "username",
+})
+SENSITIVE_HEADERS = frozenset({"authorization", "cookie", "set-cookie"})
+# Keys holding ids that are not UUIDs
+ID_KEYS = frozenset({"deviceId", "accountId", "userId", "email"})
+# Function values that identify a network or location
+SENSITIVE_FUNCTION_CLASSES = frozenset({
+    "wifi-ssid", "wifi-mac-address", "ble-mac-address", "geo-coordinates",
+})
+
+_UUID = re.compile(r"[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}", re.IGNORECASE)
+_SENSITIVE_PARAM = re.compile(
+    r"(?<=[?&;])(" + "|".join(re.escape(key) for key in sorted(SENSITIVE_KEYS)) + r")=[^&;\"'\s<>]*"
+)
+
+
+class Redactor:
+    """Replace secrets with REDACTED and ids with stand-ins
+
+    Each id maps to the same stand-in UUID everywhere it appears, in URLs and bodies alike,
+    so a recording stays internally consistent: ids in a metadevices response match the ids
+    in later state URLs for the same devices.
+    """
+
+    def __init__(self) -> None:
+        self._ids = {}  # type: Dict[str, str]
+        # Ids that are not UUIDs, which can only be found in free text by searching for each one
+        self._other_ids = {}  # type: Dict[str, str]
+
+    def _id(self, original: str) -> str:
+        if original not in self._ids:
+            self._ids[original] = str(uuid.UUID(int=len(self._ids) + 1))
+            if not _UUID.fullmatch(original):
+                self._other_ids[original] = self._ids[original]
+        return self._ids[original]
+
+    def _string(self, text: str) -> str:
+        text = _SENSITIVE_PARAM.sub(lambda match: f"{match.group(1)}={REDACTED}", text)
+        return _UUID.sub(lambda match: self._id(match.group(0)), text)
+
+    def text(self, text: str) -> str:
+        """Redact secrets in query-string form and ids in free text, e.g. URLs or HTML"""
+        text = self._string(text)
+        for original, stand_in in self._other_ids.items():
+            text = text.replace(original, stand_in)
+        return text
+
+    def json(self, obj: Any) -> Any:
+        """Redact secrets and ids in a decoded JSON document"""
+        if isinstance(obj, dict):
+            if obj.get("functionClass") in SENSITIVE_FUNCTION_CLASSES and "value" in obj:
+                obj = dict(obj, value=REDACTED)
+            redacted = {}
+            for key, value in obj.items():
+                if key in SENSITIVE_KEYS and value is not None:
+                    redacted[key] = REDACTED
+                elif key in ID_KEYS and isinstance(value, str):
+                    redacted[key] = self._id(value)
+                else:
+                    redacted[key] = self.json(value)
+            return redacted
+        if isinstance(obj, list):
+            return [self.json(item) for item in obj]
+        if isinstance(obj, str):
+            return self._ids.get(obj) or self._string(obj)
+        return obj
+
+    def headers(self, headers) -> list:
+        """Redact credentials in headers, returned as a list of [name, value] pairs"""
+        return [
+            [name, REDACTED if name.lower() in SENSITIVE_HEADERS else self.text(str(value))]
+            for name, value in (headers.items() if headers else [])
+        ]
+
+    def body(self, body: str) -> str:
+        """Redact a response body, as JSON if it parses and as text otherwise"""
+        try:
+            return json.dumps(self.json(json.loads(body)))
+        except ValueError:
+            return self.text(body)
+
+
+def _replay_key(method: str, url: str) -> Tuple[str, str]:
+    """Match requests on method and URL without the query string, which can hold one-off values"""
+    return method.upper(), str(URL(url).with_query(None))
+
+
+class TrafficRecorder(Transport):
+    """Record every request and response to a JSONL file, redacted, while sending them as usual"""
+
+    def __init__(self, path: str, transport: Optional[Transport] = None) -> None:
+        self.path = path
+        self._transport = transport or Transport()
+        self._redactor = Redactor()
+        self._lock = asyncio.Lock()
+
+    async def send(self, websession: ClientSession, method: str, url: str, **kwargs) -> ClientResponse:
+        raise_for_status = kwargs.pop("raise_for_status", False)
+        started = time.monotonic()
+        resp = await self._transport.send(websession, method, url, raise_for_status=False, **kwargs)
+        # Reading caches the body, so callers can still read the response afterwards
+        body = (await resp.read()).decode("utf-8", "replace")
+        latency = time.monotonic() - started
+
+        redactor = self._redactor
+        request_url = URL(url).update_query(kwargs.get("params") or {})
+        record = {
+            "time": datetime.utcnow().isoformat(),
+            "method": method.upper(),
+            "url": redactor.text(str(request_url)),
+            "request": {
+                "headers": redactor.headers(kwargs.get("headers")),
+                "data": redactor.json(kwargs.get("data")),
+                "json": redactor.json(kwargs.get("json")),
+            },
+            "status": resp.status,
+            "reason": resp.reason,
+            "headers": redactor.headers(resp.headers),
+            "body": redactor.body(body),
+            "latency": latency,
+        }
+        async with self._lock:
+            await asyncio.get_running_loop().run_in_executor(None, self._append, json.dumps(record))
+
+        if raise_for_status:
+            resp.raise_for_status()
+        return resp
+
+    def _append(self, line: str) -> None:
+        with open(self.path, "a", encoding="utf-8") as record_file:
+            record_file.write(line + "\n")
+
+
+class RecordedResponse:
+    """A response served from a recording, with the parts of ClientResponse this package uses"""
+
+    def __init__(self, method: str, record: dict) -> None:
+        self.method = method
+        self.url = URL(record["url"])
+        self.status = record["status"]
+        self.reason = record.get("reason")
+        self.headers = CIMultiDictProxy(CIMultiDict(record.get("headers", [])))
+        self.raw_headers = tuple(
+            (name.encode("utf-8"), value.encode("utf-8")) for name, value in record.get("headers", [])
+        )
+        self._body = record.get("body", "")
+
+    @property
+    def ok(self) -> bool:  # pylint: disable=invalid-name
+        """Return whether the status is below 400"""
+        return self.status < 400
+
+    @property
+    def request_info(self) -> RequestInfo:
+        """Return details of the recorded request"""
+        return RequestInfo(self.url, self.method, CIMultiDictProxy(CIMultiDict()), self.url)
+
+    async def read(self) -> bytes:
+        """Return the body"""
+        return self._body.encode("utf-8")
+
+    async def text(self, encoding: Optional[str] = None) -> str:  # pylint: disable=unused-argument
+        """Return the body as text"""
+        return self._body
+
+    async def json(self, content_type: Optional[str] = None, **kwargs) -> Any:  # pylint: disable=unused-argument
+        """Return the body decoded as JSON, or None if it is empty"""
+        return json.loads(self._body) if self._body.strip() else None
+
+    def raise_for_status(self) -> None:
+        """Raise ClientResponseError for a recorded error status, as aiohttp would"""
+        if not self.ok:
+            raise ClientResponseError(
+                self.request_info, (), status=self.status, message=self.reason or "", headers=self.headers
+            )
+
+    def release(self) -> None:
+        """Nothing to release; present for compatibility with ClientResponse"""
+
+
+class ReplayTransport(Transport):
+    """Serve recorded responses instead of sending requests
+
+    Requests are matched on method and URL, ignoring the query string, and each match is
+    served the recorded responses in order; once they run out, the last one is repeated so
+    update loops can keep running. With latency, each response is delayed by the time the
+    original request took.
+    """
+
+    def __init__(self, path: str, latency: bool = False) -> None:
+        self.path = path
+        self.latency = latency
+        self._records = defaultdict(deque)  # type: Dict[Tuple[str, str], Deque[dict]]
+        with open(path, "r", encoding="utf-8") as record_file:
+            for line in record_file:
+                if line.strip():
+                    record = json.loads(line)
+                    self._records[_replay_key(record["method"], record["url"])].append(record)
+
+    def remaining(self) -> int:
+        """Return how many recorded responses have not been served yet"""
+        return sum(max(len(records) - 1, 0) for records in self._records.values())
+
+    async def send(self, websession: ClientSession, method: str, url: str, **kwargs) -> RecordedResponse:
+        records = self._records.get(_replay_key(method, url))
+        if not records:
+            raise ClientConnectionError(f"No recorded response for {method.upper()} {url}")
+        record = records.popleft() if len(records) > 1 else records[0]
+        if self.latency:
+            await asyncio.sleep(record.get("latency", 0))
+        resp = RecordedResponse(method.upper(), record)
+        if kwargs.get("raise_for_status"):
+            resp.raise_for_status()
+        return resp
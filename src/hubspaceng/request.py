@@ -3,6 +3,7 @@ import asyncio
 from datetime import timedelta
 from json import JSONDecodeError
 import logging
+import time
 from typing import Optional, Tuple
 
 from aiohttp import ClientResponse, ClientSession
@@ -12,24 +13,45 @@ from aiohttp.client_exceptions import (
     ClientResponseError,
     ServerDisconnectedError,
 )
+from yarl import URL
 
+from .connection import ConnectionManager
 from .const import USER_AGENT
 from .errors import RequestError
+from .metrics import MetricsRegistry
+from .retry import RetryPolicy
 
 _LOGGER = logging.getLogger(__name__)
 
 REQUEST_METHODS = dict(
     json="request_json", text="request_text", response="request_response"
 )
-DEFAULT_REQUEST_RETRIES = 5
 USER_AGENT_REFRESH = timedelta(hours=1)
 
 
+class Transport:
+    """Sends a single HTTP request; replace it to record or replay traffic"""
+
+    async def send(self, websession: ClientSession, method: str, url: str, **kwargs) -> ClientResponse:
+        """Send a request, with the keyword arguments of ClientSession.request"""
+        return await websession.request(method, url, **kwargs)
+
+
 class HubspaceRequest:  # pylint: disable=too-many-instance-attributes
     """Define a class to handle requests to Hubspace"""
 
-    def __init__(self, websession: ClientSession = None) -> None:
-        self._websession = websession or ClientSession()
+    def __init__(
+        self,
+        websession: ClientSession = None,
+        connections: ConnectionManager = None,
+        metrics: MetricsRegistry = None,
+        transport: Transport = None,
+        retry_policy: RetryPolicy = None,
+    ) -> None:
+        self._connections = connections or ConnectionManager(websession)
+        self.metrics = metrics or MetricsRegistry()
+        self.transport = transport or Transport()
+        self.retry_policy = retry_policy or RetryPolicy()
         self._useragent = None
         self._last_useragent_update = None
 
@@ -49,35 +71,27 @@ class HubspaceRequest:  # pylint: disable=too-many-instance-attributes
         allow_redirects: bool = False,
     ) -> Optional[ClientResponse]:
 
+        host = URL(url).host
         attempt = 0
-        resp = None
-        resp_exc = None
-        last_status = ""
-        last_error = ""
+        wait_for = None
 
-        for attempt in range(DEFAULT_REQUEST_RETRIES):
+        while True:
+            refreshed_useragent = False
             if self._useragent is not None and self._useragent != "":
                 headers.update({"User-Agent": self._useragent})
 
-            if attempt != 0:
-                wait_for = min(2 ** attempt, 5)
-                _LOGGER.debug(
-                    'Request failed with "%s %s" (attempt #%s/%s)"; trying again in %s seconds',
-                    last_status,
-                    last_error,
-                    attempt,
-                    DEFAULT_REQUEST_RETRIES,
-                    wait_for,
-                )
-                await asyncio.sleep(wait_for)
+            # Fails fast with CircuitOpenError while the host keeps failing
+            self.retry_policy.check(host)
 
+            started = time.monotonic()
             try:
                 _LOGGER.debug(
                     "Sending hubspace api request %s and headers %s with connection pooling",
                     url,
                     headers,
                 )
-                resp = await websession.request(
+                resp = await self.transport.send(
+                    websession,
                     method,
                     url,
                     headers=headers,
@@ -88,6 +102,8 @@ class HubspaceRequest:  # pylint: disable=too-many-instance-attributes
                     allow_redirects=allow_redirects,
                     raise_for_status=True,
                 )
+                self.metrics.observe_request(method, url, resp.status, time.monotonic() - started)
+                self.retry_policy.record(host, None)
 
                 _LOGGER.debug("Response:")
                 _LOGGER.debug("    Response Code: %s", resp.status)
@@ -95,6 +111,8 @@ class HubspaceRequest:  # pylint: disable=too-many-instance-attributes
                 _LOGGER.debug("    Body: %s", await resp.text())
                 return resp
             except ClientResponseError as err:
+                self.metrics.observe_request(method, url, err.status, time.monotonic() - started)
+                self.retry_policy.record(host, err)
                 _LOGGER.debug(
                     "Attempt %s request failed with exception : %s - %s",
                     attempt + 1,
@@ -113,8 +131,11 @@ class HubspaceRequest:  # pylint: disable=too-many-instance-attributes
                         "Received error status 400, bad request. Will refresh user agent."
                     )
                     await self._get_useragent()
+                    refreshed_useragent = True
 
             except (ClientOSError, ServerDisconnectedError) as err:
+                self.metrics.observe_request(method, url, None, time.monotonic() - started)
+                self.retry_policy.record(host, err)
                 errno = getattr(err, "errno", -1)
                 if errno in (-1, 54, 104) and attempt == 0:
                     _LOGGER.debug(
@@ -133,6 +154,8 @@ class HubspaceRequest:  # pylint: disable=too-many-instance-attributes
                 resp_exc = err
 
             except ClientError as err:
+                self.metrics.observe_request(method, url, None, time.monotonic() - started)
+                self.retry_policy.record(host, err)
                 _LOGGER.debug(
                     "Attempt %s request failed with exception: %s",
                     attempt,
@@ -142,10 +165,27 @@ class HubspaceRequest:  # pylint: disable=too-many-instance-attributes
                 last_error = str(err)
                 resp_exc = err
 
-        if resp_exc is not None:
-            raise resp_exc
-
-        return resp
+            attempt += 1
+            wait_for = self.retry_policy.next_delay(
+                method, host, attempt, wait_for, resp_exc, refreshed_useragent=refreshed_useragent
+            )
+            if wait_for is None:
+                raise resp_exc
+            _LOGGER.debug(
+                'Request failed with "%s %s" (attempt #%s/%s)"; trying again in %.2f seconds',
+                last_status,
+                last_error,
+                attempt,
+                self.retry_policy.max_attempts,
+                wait_for,
+            )
+            self.metrics.observe_retry(method, url, wait_for)
+            await asyncio.sleep(wait_for)
+
+    @property
+    def connections(self) -> ConnectionManager:
+        """Return the connection manager requests are sent through"""
+        return self._connections
 
     async def request_json(
         self,
@@ -177,7 +217,7 @@ class HubspaceRequest:  # pylint: disable=too-many-instance-attributes
             Tuple[Optional[ClientResponse], Optional[dict]]: [description]
         """
 
-        websession = websession or self._websession
+        websession = websession or self._connections.session
         json_data = None
 
         resp = await self._send_request(
@@ -231,7 +271,7 @@ class HubspaceRequest:  # pylint: disable=too-many-instance-attributes
             Tuple[Optional[ClientResponse], Optional[str]]: [description]
         """
 
-        websession = websession or self._websession
+        websession = websession or self._connections.session
         data_text = None
         resp = await self._send_request(
             method=method,
@@ -276,7 +316,7 @@ class HubspaceRequest:  # pylint: disable=too-many-instance-attributes
             Tuple[Optional[ClientResponse], None]: [description]
         """
 
-        websession = websession or self._websession
+        websession = websession or self._connections.session
 
         return (
             await self._send_request(
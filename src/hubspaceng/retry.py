@@ -0,0 +1,247 @@
+"""Decide whether and when failed requests are retried, per host"""
+import asyncio
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+import logging
+import random
+import time
+from typing import Dict, FrozenSet, Optional
+
+from aiohttp.client_exceptions import ClientConnectorError, ClientError, ClientResponseError
+
+from hubspaceng.const import (
+    DEFAULT_CIRCUIT_FAILURE_THRESHOLD,
+    DEFAULT_CIRCUIT_RESET_TIMEOUT,
+    DEFAULT_REQUEST_RETRIES,
+    DEFAULT_RETRY_AFTER_MAX,
+    DEFAULT_RETRY_BASE_DELAY,
+    DEFAULT_RETRY_BUDGET_BURST,
+    DEFAULT_RETRY_BUDGET_RATE,
+    DEFAULT_RETRY_MAX_DELAY
+)
+from hubspaceng.deadline import remaining
+from hubspaceng.errors import CircuitOpenError
+from hubspaceng.scheduler import TokenBucket
+
+_LOGGER = logging.getLogger(__name__)
+
+# Methods that can be sent twice without changing the outcome
+IDEMPOTENT_METHODS = frozenset({"GET", "HEAD", "OPTIONS"})
+# Statuses worth retrying at all
+RETRY_STATUSES = frozenset({408, 429, 500, 502, 503, 504})
+# Statuses the server sends without acting on the request, so any method can be retried
+REFUSED_STATUSES = frozenset({429, 503})
+
+
+def retry_after(err: ClientResponseError) -> Optional[float]:
+    """Return the seconds a Retry-After header asks to wait, or None if there isn't one"""
+    value = (err.headers or {}).get("Retry-After")
+    if value is None:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max((when - datetime.now(timezone.utc)).total_seconds(), 0.0)
+
+
+class CircuitBreaker:
+    """Fail fast while a host keeps failing
+
+    After `threshold` consecutive failures the circuit opens and requests are refused for
+    `reset_timeout` seconds. Then one trial request is let through (half-open): success
+    closes the circuit, failure opens it again.
+    """
+
+    def __init__(self, threshold: int, reset_timeout: float) -> None:
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self._opened_at = None  # type: Optional[float]
+        self._half_open = False
+
+    @property
+    def state(self) -> str:
+        """Return closed, open or half-open"""
+        if self._opened_at is None:
+            return "closed"
+        return "half-open" if self._half_open else "open"
+
+    def retry_in(self) -> float:
+        """Return the seconds until a trial request will be let through"""
+        if self._opened_at is None:
+            return 0.0
+        return max(self._opened_at + self.reset_timeout - time.monotonic(), 0.0)
+
+    def allow(self) -> bool:
+        """Return whether a request may be sent now"""
+        if self._opened_at is None:
+            return True
+        if self.retry_in() > 0:
+            return False
+        # Let one trial through per reset period, in case its result is never reported
+        self._opened_at = time.monotonic()
+        self._half_open = True
+        return True
+
+    def record_success(self) -> None:
+        """Record that the host answered"""
+        self.failures = 0
+        self._opened_at = None
+        self._half_open = False
+
+    def record_failure(self) -> bool:
+        """Record that the host failed; returns True if this opened the circuit"""
+        self.failures += 1
+        if self._half_open or (self._opened_at is None and self.failures >= self.threshold):
+            self._opened_at = time.monotonic()
+            self._half_open = False
+            return True
+        return False
+
+
+class RetryPolicy:  # pylint: disable=too-many-instance-attributes
+    """Retry failed requests with decorrelated jitter, within a per-host retry budget
+
+    A request is retried when it failed with a status in `retry_statuses` or a connection
+    error. Requests with methods outside `idempotent_methods` are only retried when the
+    server cannot have acted on them: the connection was never made, or the server refused
+    the request with 429 or 503. Retry-After is honoured up to `max_retry_after` seconds;
+    longer waits fail the request instead. Each host has a token bucket of retries refilling
+    at `budget_rate` per second, so a struggling host is not hit with a retry storm, and a
+    circuit breaker that refuses requests while the host keeps failing.
+
+    Subclass and override `delay` or `is_retryable` to change the rules.
+    """
+
+    def __init__(
+        self,
+        max_attempts: int = DEFAULT_REQUEST_RETRIES,
+        base_delay: float = DEFAULT_RETRY_BASE_DELAY,
+        max_delay: float = DEFAULT_RETRY_MAX_DELAY,
+        max_retry_after: float = DEFAULT_RETRY_AFTER_MAX,
+        budget_rate: Optional[float] = DEFAULT_RETRY_BUDGET_RATE,
+        budget_burst: int = DEFAULT_RETRY_BUDGET_BURST,
+        circuit_threshold: Optional[int] = DEFAULT_CIRCUIT_FAILURE_THRESHOLD,
+        circuit_reset_timeout: float = DEFAULT_CIRCUIT_RESET_TIMEOUT,
+        idempotent_methods: FrozenSet[str] = IDEMPOTENT_METHODS,
+        retry_statuses: FrozenSet[int] = RETRY_STATUSES,
+    ) -> None:
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_retry_after = max_retry_after
+        self.budget_rate = budget_rate
+        self.budget_burst = budget_burst
+        self.circuit_threshold = circuit_threshold
+        self.circuit_reset_timeout = circuit_reset_timeout
+        self.idempotent_methods = frozenset(method.upper() for method in idempotent_methods)
+        self.retry_statuses = frozenset(retry_statuses)
+        self._budgets = {}  # type: Dict[str, TokenBucket]
+        self._breakers = {}  # type: Dict[str, CircuitBreaker]
+
+    def breaker(self, host: str) -> Optional[CircuitBreaker]:
+        """Return the circuit breaker for a host, or None if circuit breaking is disabled"""
+        if self.circuit_threshold is None:
+            return None
+        breaker = self._breakers.get(host)
+        if breaker is None:
+            breaker = self._breakers[host] = CircuitBreaker(self.circuit_threshold, self.circuit_reset_timeout)
+        return breaker
+
+    def _budget(self, host: str) -> TokenBucket:
+        budget = self._budgets.get(host)
+        if budget is None:
+            budget = self._budgets[host] = TokenBucket(self.budget_rate, self.budget_burst)
+        return budget
+
+    def check(self, host: str) -> None:
+        """Raise CircuitOpenError if requests to host are being refused"""
+        breaker = self.breaker(host)
+        if breaker is not None and not breaker.allow():
+            raise CircuitOpenError(
+                f"Requests to {host} are failing; not retrying for another {breaker.retry_in():.1f} seconds"
+            )
+
+    def record(self, host: str, err: Optional[BaseException]) -> None:
+        """Record the outcome of an attempt; err is None on success"""
+        breaker = self.breaker(host)
+        if breaker is None:
+            return
+        if err is None or (isinstance(err, ClientResponseError) and err.status < 500):
+            # Any response short of a server error shows the host is up
+            breaker.record_success()
+        elif breaker.record_failure():
+            _LOGGER.warning(
+                "Opening circuit for %s after %s consecutive failures", host, breaker.failures
+            )
+
+    def is_retryable(self, method: str, err: BaseException) -> bool:
+        """Return whether a request that failed with err may be sent again"""
+        idempotent = method.upper() in self.idempotent_methods
+        if isinstance(err, ClientResponseError):
+            if err.status not in self.retry_statuses:
+                return False
+            return idempotent or err.status in REFUSED_STATUSES
+        if isinstance(err, ClientConnectorError):
+            # The connection was never made, so nothing was sent
+            return True
+        return idempotent and isinstance(err, (ClientError, asyncio.TimeoutError))
+
+    def delay(self, attempt: int, previous: Optional[float], err: BaseException) -> Optional[float]:
+        """Return seconds to wait before the next attempt, or None to give up
+
+        Waits are decorrelated jitter, drawn between base_delay and three times the previous
+        wait and capped at max_delay, and never shorter than a Retry-After header asks for.
+        """
+        jitter = min(self.max_delay, random.uniform(self.base_delay, max(previous or 0, self.base_delay) * 3))
+        if isinstance(err, ClientResponseError):
+            wait = retry_after(err)
+            if wait is not None:
+                if wait > self.max_retry_after:
+                    _LOGGER.debug("Retry-After of %s seconds is too long; not retrying", wait)
+                    return None
+                return max(wait, jitter)
+        return jitter
+
+    def next_delay(
+        self,
+        method: str,
+        host: str,
+        attempt: int,
+        previous: Optional[float],
+        err: BaseException,
+        refreshed_useragent: bool = False,
+    ) -> Optional[float]:
+        """Return seconds to wait before retrying after `attempt` failed attempts, or None to give up
+
+        refreshed_useragent means the request was rejected and the user agent has since been
+        refreshed, so it is worth sending again whatever the error.
+        """
+        if attempt >= self.max_attempts:
+            return None
+        if not (refreshed_useragent or self.is_retryable(method, err)):
+            return None
+        breaker = self.breaker(host)
+        if breaker is not None and breaker.state != "closed":
+            # Give up with the real error rather than waiting to be refused
+            return None
+        wait = self.delay(attempt, previous, err)
+        if wait is None:
+            return None
+        time_left = remaining()
+        if time_left is not None and wait >= time_left:
+            _LOGGER.debug("Retrying in %.2f seconds would pass the deadline; not retrying", wait)
+            return None
+        budget = self._budget(host)
+        if budget.delay() > 0:
+            _LOGGER.debug("Retry budget for %s is exhausted; not retrying", host)
+            return None
+        budget.consume()
+        return wait
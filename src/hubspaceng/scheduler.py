@@ -0,0 +1,250 @@
+"""Schedule requests to the Hubspace API within concurrency and rate limits"""
+import asyncio
+from collections import defaultdict, deque
+from contextlib import asynccontextmanager
+from enum import IntEnum
+import logging
+import time
+from typing import Deque, Dict, Optional, Tuple
+
+from hubspaceng.const import (
+    DEFAULT_MAX_CONCURRENT_REQUESTS,
+    DEFAULT_MAX_CONCURRENT_REQUESTS_PER_HOST,
+    DEFAULT_REQUEST_BURST,
+    DEFAULT_REQUEST_RATE,
+    DEFAULT_RESERVED_INTERACTIVE_SLOTS,
+    DEFAULT_RESERVED_INTERACTIVE_TOKENS
+)
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class Priority(IntEnum):
+    """Dispatch lanes for requests; lower values are granted slots first"""
+    INTERACTIVE = 0
+    NORMAL = 1
+    BACKGROUND = 2
+
+
+class LaneStats:
+    """Queue wait statistics for a single priority lane"""
+
+    def __init__(self) -> None:
+        self.requests = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def record(self, wait: float) -> None:
+        """Record how long a request waited for a slot"""
+        self.requests += 1
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+
+    @property
+    def mean_wait(self) -> float:
+        """Return the mean time requests waited for a slot"""
+        return self.total_wait / self.requests if self.requests else 0.0
+
+
+class TokenBucket:
+    """Token-bucket rate limiter; allows bursts of up to `burst` requests, refilling at `rate` per second
+
+    A rate of None means no limit.
+    """
+
+    def __init__(self, rate: Optional[float], burst: int) -> None:
+        if rate is not None and rate <= 0:
+            raise ValueError("Rate must be greater than 0, or None for no limit")
+        if burst < 1:
+            raise ValueError("Burst must be at least 1")
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._last_refill = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._last_refill) * self.rate)
+        self._last_refill = now
+
+    def delay(self, reserve: float = 0) -> float:
+        """Return how many seconds until a token is available without dipping into `reserve`
+        tokens, 0 if one is available now"""
+        if self.rate is None:
+            return 0.0
+        self._refill()
+        needed = 1 + reserve
+        if self._tokens >= needed:
+            return 0.0
+        return (needed - self._tokens) / self.rate
+
+    def consume(self) -> None:
+        """Take a token from the bucket"""
+        if self.rate is not None:
+            self._refill()
+            self._tokens -= 1
+
+
+class RequestScheduler:  # pylint: disable=too-many-instance-attributes
+    """Dispatch requests under global and per-host concurrency limits and a rate limit.
+
+    Waiting requests are granted by priority lane, then in FIFO order within a lane; a
+    request for a host that is at its limit does not hold up requests for other hosts
+    queued behind it. `reserved_slots` slots, both globally and per host, and `reserved_tokens`
+    of the rate limiter's burst are kept for interactive requests, so user commands never
+    queue behind a full load of polling. Other requests share the rest of the burst; raising
+    `burst` instead would let polling spend it too.
+    """
+
+    def __init__(
+        self,
+        max_concurrent: int = DEFAULT_MAX_CONCURRENT_REQUESTS,
+        max_concurrent_per_host: int = DEFAULT_MAX_CONCURRENT_REQUESTS_PER_HOST,
+        rate: Optional[float] = DEFAULT_REQUEST_RATE,
+        burst: int = DEFAULT_REQUEST_BURST,
+        reserved_slots: int = DEFAULT_RESERVED_INTERACTIVE_SLOTS,
+        reserved_tokens: int = DEFAULT_RESERVED_INTERACTIVE_TOKENS,
+    ) -> None:
+        if max_concurrent < 1 or max_concurrent_per_host < 1:
+            raise ValueError("Concurrency limits must be at least 1")
+        self.max_concurrent = max_concurrent
+        self.max_concurrent_per_host = max_concurrent_per_host
+        self.reserved_slots = min(reserved_slots, max_concurrent - 1)
+        # Almost all traffic goes to one host, so the reservation must hold there too
+        self.reserved_host_slots = min(reserved_slots, max_concurrent_per_host - 1)
+        self._bucket = TokenBucket(rate, burst)
+        self.reserved_tokens = max(0, min(reserved_tokens, burst - 1))
+        self._active = 0
+        self._active_per_host = defaultdict(int)  # type: Dict[str, int]
+        self._waiters = {
+            priority: deque() for priority in Priority
+        }  # type: Dict[Priority, Deque[Tuple[str, asyncio.Future, float]]]
+        self._stats = {priority: LaneStats() for priority in Priority}  # type: Dict[Priority, LaneStats]
+        self._timer = None  # type: Optional[asyncio.TimerHandle]
+
+    @property
+    def active(self) -> int:
+        """Return the number of requests currently in flight"""
+        return self._active
+
+    @property
+    def queued(self) -> int:
+        """Return the number of requests waiting for a slot"""
+        return sum(len(waiters) for waiters in self._waiters.values())
+
+    def queue_metrics(self) -> Dict[str, dict]:
+        """Return queue depth and queue wait statistics (in seconds) per priority lane"""
+        return {
+            priority.name.lower(): {
+                "queued": len(self._waiters[priority]),
+                "requests": stats.requests,
+                "total_wait": stats.total_wait,
+                "mean_wait": stats.mean_wait,
+                "max_wait": stats.max_wait,
+            }
+            for priority, stats in self._stats.items()
+        }
+
+    def _global_limit(self, priority: Priority) -> int:
+        if priority == Priority.INTERACTIVE:
+            return self.max_concurrent
+        return self.max_concurrent - self.reserved_slots
+
+    def _host_limit(self, priority: Priority) -> int:
+        if priority == Priority.INTERACTIVE:
+            return self.max_concurrent_per_host
+        return self.max_concurrent_per_host - self.reserved_host_slots
+
+    def _token_reserve(self, priority: Priority) -> int:
+        return 0 if priority == Priority.INTERACTIVE else self.reserved_tokens
+
+    def _has_capacity(self, host: str, priority: Priority) -> bool:
+        return (
+            self._active < self._global_limit(priority)
+            and self._active_per_host[host] < self._host_limit(priority)
+        )
+
+    def _start(self, host: str, priority: Priority, enqueued: float) -> None:
+        self._bucket.consume()
+        self._active += 1
+        self._active_per_host[host] += 1
+        self._stats[priority].record(time.monotonic() - enqueued)
+
+    def _release(self, host: str) -> None:
+        self._active -= 1
+        self._active_per_host[host] -= 1
+        if self._active_per_host[host] == 0:
+            del self._active_per_host[host]
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        """Grant slots to as many waiters as the limits allow, highest priority and oldest first"""
+        for priority in Priority:
+            waiters = self._waiters[priority]
+            blocked_hosts = set()
+            for waiter in list(waiters):
+                host, future, enqueued = waiter
+                if future.done():
+                    # Cancelled while waiting
+                    waiters.remove(waiter)
+                    continue
+                if self._active >= self._global_limit(priority):
+                    break
+                if host in blocked_hosts or not self._has_capacity(host, priority):
+                    # Keep FIFO order within a host
+                    blocked_hosts.add(host)
+                    continue
+                delay = self._bucket.delay(self._token_reserve(priority))
+                if delay > 0:
+                    self._dispatch_later(delay)
+                    return
+                waiters.remove(waiter)
+                self._start(host, priority, enqueued)
+                future.set_result(None)
+
+    def _dispatch_later(self, delay: float) -> None:
+        loop = asyncio.get_running_loop()
+        when = loop.time() + delay
+        if self._timer is not None:
+            if self._timer.when() <= when:
+                return
+            # An interactive request can go sooner than the waiter the timer was set for
+            self._timer.cancel()
+        self._timer = loop.call_at(when, self._on_timer)
+
+    def _on_timer(self) -> None:
+        self._timer = None
+        self._dispatch()
+
+    async def _acquire(self, host: str, priority: Priority) -> None:
+        enqueued = time.monotonic()
+        if (
+            not any(self._waiters[lane] for lane in Priority if lane <= priority)
+            and self._has_capacity(host, priority)
+            and self._bucket.delay(self._token_reserve(priority)) == 0
+        ):
+            self._start(host, priority, enqueued)
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        waiter = (host, future, enqueued)
+        self._waiters[priority].append(waiter)
+        self._dispatch()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # The slot was granted as we were cancelled; hand it back
+                self._release(host)
+            elif waiter in self._waiters[priority]:
+                self._waiters[priority].remove(waiter)
+            raise
+
+    @asynccontextmanager
+    async def slot(self, host: str, priority: Priority = Priority.NORMAL):
+        """Wait for, then hold, a request slot for the given host"""
+        await self._acquire(host, priority)
+        try:
+            yield
+        finally:
+            self._release(host)
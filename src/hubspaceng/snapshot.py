@@ -0,0 +1,115 @@
+"""Save and restore the last-known accounts, places, devices and state, for fast startup"""
+import asyncio
+from datetime import datetime
+import gzip
+import json
+import logging
+import os
+from typing import TYPE_CHECKING, Optional
+
+from hubspaceng.account import HubspaceAccount
+from hubspaceng.errors import HubspaceError
+from hubspaceng.models.devices.base import BaseDevice
+from hubspaceng.util import atomic_write, get_utc_time
+
+if TYPE_CHECKING:
+    from hubspaceng.api import API
+
+_LOGGER = logging.getLogger(__name__)
+
+# Bump whenever the layout below changes; snapshots with another version are ignored
+SNAPSHOT_VERSION = 1
+
+
+def _device_metadevice(device: BaseDevice, utc_time: int) -> dict:
+    """Return the metadevice JSON for a device, with its state replaced by the current values"""
+    values = []
+    for function in device.functions:
+        value = function.get_state()
+        if value is not None:
+            values.append(function.build_state_value(function.get_serializable_state(value), utc_time))
+    metadevice = dict(device.device_json)
+    metadevice['state'] = dict(device.device_json.get('state') or {}, values=values)
+    return metadevice
+
+
+def build_snapshot(api: "API") -> dict:
+    """Build a snapshot of every account, in the metadevices format the API server returns"""
+    utc_time = get_utc_time()
+    accounts = []
+    for account in api.accounts.values():
+        metadevices = [place.device_json for place in account.homes.values()]
+        metadevices.extend(place.device_json for place in account.rooms.values())
+        # pylint: disable=protected-access
+        devices = list(account._combodevices.values()) + list(account.devices.values())
+        metadevices.extend(_device_metadevice(device, utc_time) for device in devices)
+        accounts.append({"account": account.account_json, "metadevices": metadevices})
+    return {
+        "version": SNAPSHOT_VERSION,
+        "created": datetime.utcnow().isoformat(),
+        "username": api.username,
+        "accounts": accounts,
+    }
+
+
+def restore_snapshot(api: "API", snapshot: dict) -> bool:
+    """Build accounts and devices from a snapshot, marking every device stale
+
+    Returns False, leaving the API untouched, if the snapshot has another version or
+    belongs to another user.
+    """
+    if snapshot.get("version") != SNAPSHOT_VERSION:
+        _LOGGER.debug("Ignoring snapshot with version %s", snapshot.get("version"))
+        return False
+    if snapshot.get("username") != api.username:
+        _LOGGER.debug("Ignoring snapshot for another user")
+        return False
+
+    accounts = {}
+    for entry in snapshot.get("accounts", []):
+        account = HubspaceAccount(api=api, account_json=entry["account"])
+        account._parse_metadevices(entry["metadevices"])  # pylint: disable=protected-access
+        for device in list(account._combodevices.values()) + list(account.devices.values()):  # pylint: disable=protected-access
+            device.stale = True
+        accounts[account.id] = account
+    api._accounts = accounts  # pylint: disable=protected-access
+    _LOGGER.debug("Restored %s devices from snapshot created %s", len(api.devices), snapshot.get("created"))
+    return True
+
+
+def _write_snapshot(path: str, snapshot: dict) -> None:
+    data = json.dumps(snapshot, separators=(",", ":")).encode("utf-8")
+    atomic_write(path, gzip.compress(data))
+
+
+def _read_snapshot(path: str) -> Optional[dict]:
+    try:
+        with gzip.open(path, "rb") as snapshot_file:
+            return json.loads(snapshot_file.read())
+    except FileNotFoundError:
+        return None
+    except (OSError, EOFError, ValueError) as err:
+        _LOGGER.warning("Ignoring unreadable snapshot %s: %s", path, err)
+        return None
+
+
+async def save_snapshot(api: "API", path: str) -> None:
+    """Write a gzipped JSON snapshot of every account to a file"""
+    snapshot = build_snapshot(api)
+    await asyncio.get_running_loop().run_in_executor(
+        None, _write_snapshot, os.path.expanduser(path), snapshot
+    )
+
+
+async def load_snapshot(api: "API", path: str) -> bool:
+    """Restore accounts and devices from a snapshot file; returns whether one was restored"""
+    snapshot = await asyncio.get_running_loop().run_in_executor(
+        None, _read_snapshot, os.path.expanduser(path)
+    )
+    if not isinstance(snapshot, dict):
+        return False
+    try:
+        return restore_snapshot(api, snapshot)
+    except (HubspaceError, KeyError, TypeError, ValueError) as err:
+        _LOGGER.warning("Ignoring invalid snapshot %s: %s", path, err)
+        return False
@@ -0,0 +1,120 @@
+"""Persistent storage for OAuth tokens, so restarts can skip the login flow"""
+import asyncio
+from dataclasses import asdict, dataclass
+from datetime import datetime
+import json
+import logging
+import os
+from typing import Dict, Optional
+
+from hubspaceng.const import DEFAULT_TOKEN_FILE
+from hubspaceng.util import atomic_write
+
+_LOGGER = logging.getLogger(__name__)
+
+
+@dataclass
+class StoredToken:
+    """An access token and refresh token as issued by the OAuth token endpoint; times are UTC"""
+    access_token: str
+    issued_at: datetime
+    expires_at: datetime
+    refresh_token: Optional[str] = None
+
+    @property
+    def refresh_at(self) -> datetime:
+        """Return when the access token should be renewed, halfway through its lifetime"""
+        return self.issued_at + (self.expires_at - self.issued_at) / 2
+
+    def is_valid(self, margin: float = 0) -> bool:
+        """Return whether the access token is still valid for at least `margin` seconds"""
+        return (self.expires_at - datetime.utcnow()).total_seconds() > margin
+
+    def to_json(self) -> dict:
+        """Convert to a JSON-serializable dict"""
+        token_json = asdict(self)
+        token_json["issued_at"] = self.issued_at.isoformat()
+        token_json["expires_at"] = self.expires_at.isoformat()
+        return token_json
+
+    @classmethod
+    def from_json(cls, token_json: dict) -> "StoredToken":
+        """Create from a dict produced by to_json"""
+        return cls(
+            access_token=token_json["access_token"],
+            issued_at=datetime.fromisoformat(token_json["issued_at"]),
+            expires_at=datetime.fromisoformat(token_json["expires_at"]),
+            refresh_token=token_json.get("refresh_token"),
+        )
+
+
+class TokenStore:
+    """Storage for tokens, keyed by username; subclass to keep tokens somewhere other than a file"""
+
+    async def load(self, username: str) -> Optional[StoredToken]:
+        """Return the stored token for a user, or None if there is none"""
+        raise NotImplementedError()
+
+    async def save(self, username: str, token: StoredToken) -> None:
+        """Store the token for a user, replacing any previous one"""
+        raise NotImplementedError()
+
+    async def clear(self, username: str) -> None:
+        """Remove the stored token for a user"""
+        raise NotImplementedError()
+
+
+class FileTokenStore(TokenStore):
+    """Store tokens in a JSON file that only the current user can read
+
+    The file is replaced atomically, so a crash mid-write never leaves a truncated token file behind.
+    """
+
+    def __init__(self, path: Optional[str] = None) -> None:
+        self.path = os.path.expanduser(path or DEFAULT_TOKEN_FILE)
+        self._lock = asyncio.Lock()
+
+    def _read(self) -> Dict[str, dict]:
+        try:
+            with open(self.path, "r", encoding="utf-8") as token_file:
+                tokens = json.load(token_file)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as err:
+            _LOGGER.warning("Ignoring unreadable token file %s: %s", self.path, err)
+            return {}
+        return tokens if isinstance(tokens, dict) else {}
+
+    def _write(self, tokens: Dict[str, dict]) -> None:
+        atomic_write(self.path, json.dumps(tokens).encode("utf-8"))
+
+    def _load(self, username: str) -> Optional[StoredToken]:
+        token_json = self._read().get(username)
+        if token_json is None:
+            return None
+        try:
+            return StoredToken.from_json(token_json)
+        except (KeyError, TypeError, ValueError) as err:
+            _LOGGER.warning("Ignoring invalid stored token for %s: %s", username, err)
+            return None
+
+    def _save(self, username: str, token: Optional[StoredToken]) -> None:
+        tokens = self._read()
+        if token is None:
+            if tokens.pop(username, None) is None:
+                return
+        else:
+            tokens[username] = token.to_json()
+        self._write(tokens)
+
+    async def load(self, username: str) -> Optional[StoredToken]:
+        async with self._lock:
+            return await asyncio.get_running_loop().run_in_executor(None, self._load, username)
+
+    async def save(self, username: str, token: StoredToken) -> None:
+        async with self._lock:
+            await asyncio.get_running_loop().run_in_executor(None, self._save, username, token)
+
+    async def clear(self, username: str) -> None:
+        async with self._lock:
+            await asyncio.get_running_loop().run_in_executor(None, self._save, username, None)
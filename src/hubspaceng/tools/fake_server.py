@@ -0,0 +1,272 @@
+"""A local fake of the Hubspace cloud, for load and latency testing without a real account"""
+
+import asyncio
+import copy
+import json
+import logging
+import random
+import secrets
+import time
+from typing import Dict, Optional, Tuple, Union
+import uuid
+from zipfile import ZipFile
+
+from aiohttp import web
+
+from hubspaceng.endpoints import Endpoints
+from hubspaceng.tools.fleet import generate_fleet
+from hubspaceng.util import index_state_values
+
+_LOGGER = logging.getLogger(__name__)
+
+REALM = "/auth/realms/thd"
+
+
+class FakeHubspaceServer:  # pylint: disable=too-many-instance-attributes
+    """Serve the OAuth realm, /users/me, metadevices and metadevice state endpoints from memory
+
+    Args:
+        accounts: metadevices documents by account id
+        username, password: the credentials the login form accepts
+        latency: seconds added to every response, or a (min, max) range to draw from
+        max_concurrent: requests served at once before rate limiting kicks in; None for no limit
+        rate_limit: what happens to requests over max_concurrent; "429" responds with
+            Too Many Requests, "timeout" holds the request for `rate_limit_hold` seconds
+        error_rate: fraction of API requests that fail with `error_status`
+        token_lifetime: seconds until issued access tokens expire
+        seed: seed for latency and error injection, for repeatable runs
+    """
+
+    def __init__(
+        self,
+        accounts: Dict[str, list],
+        username: str = "user@example.com",
+        password: str = "password",
+        latency: Union[float, Tuple[float, float]] = 0,
+        max_concurrent: Optional[int] = None,
+        rate_limit: str = "429",
+        rate_limit_hold: float = 30,
+        error_rate: float = 0,
+        error_status: int = 500,
+        token_lifetime: int = 1800,
+        seed: Optional[int] = None,
+    ) -> None:
+        if rate_limit not in ("429", "timeout"):
+            raise ValueError("rate_limit must be '429' or 'timeout'")
+        self.accounts = {account_id: copy.deepcopy(doc) for account_id, doc in accounts.items()}
+        self.username = username
+        self.password = password
+        self.latency = latency
+        self.max_concurrent = max_concurrent
+        self.rate_limit = rate_limit
+        self.rate_limit_hold = rate_limit_hold
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.token_lifetime = token_lifetime
+        self._rng = random.Random(seed)
+        self._devices = {
+            (account_id, metadevice["id"]): metadevice
+            for account_id, doc in self.accounts.items()
+            for metadevice in doc
+        }
+        self._codes = set()
+        self._access_tokens = {}  # type: Dict[str, float]
+        self._refresh_tokens = set()
+        self._active = 0
+        self._runner = None  # type: Optional[web.AppRunner]
+        self.base_url = None  # type: Optional[str]
+        self.stats = {"requests": 0, "rate_limited": 0, "errors": 0, "max_concurrent_seen": 0}
+
+    @classmethod
+    def from_survey(cls, path: str, **kwargs) -> "FakeHubspaceServer":
+        """Seed from a zip written by hubspaceng.tools.survey"""
+        accounts = {}
+        with ZipFile(path) as survey_zip:
+            for name in survey_zip.namelist():
+                if name.endswith("_metadevices.json"):
+                    accounts[name[:-len("_metadevices.json")]] = json.loads(survey_zip.read(name))
+        return cls(accounts, **kwargs)
+
+    @classmethod
+    def from_fleet(cls, devices: int = 10, accounts: int = 1, seed: int = 0, **kwargs) -> "FakeHubspaceServer":
+        """Seed with generated fleets, one per account"""
+        rng = random.Random(seed)
+        docs = {
+            str(uuid.UUID(int=rng.getrandbits(128))): generate_fleet(devices=devices, seed=seed + index)
+            for index in range(accounts)
+        }
+        return cls(docs, seed=seed, **kwargs)
+
+    @property
+    def endpoints(self) -> Endpoints:
+        """Return the endpoints to pass to API or login() to use this server"""
+        if self.base_url is None:
+            raise RuntimeError("The server has not been started")
+        return Endpoints.from_base_url(self.base_url)
+
+    def _delay(self) -> float:
+        if isinstance(self.latency, tuple):
+            return self._rng.uniform(*self.latency)
+        return self.latency
+
+    @web.middleware
+    async def _middleware(self, request: web.Request, handler):
+        self.stats["requests"] += 1
+        if self.max_concurrent is not None and self._active >= self.max_concurrent:
+            self.stats["rate_limited"] += 1
+            if self.rate_limit == "timeout":
+                await asyncio.sleep(self.rate_limit_hold)
+            return web.Response(status=429, text="Too Many Requests", headers={"Retry-After": "1"})
+
+        self._active += 1
+        self.stats["max_concurrent_seen"] = max(self.stats["max_concurrent_seen"], self._active)
+        try:
+            delay = self._delay()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            if (
+                self.error_rate > 0
+                and not request.path.startswith(REALM)
+                and self._rng.random() < self.error_rate
+            ):
+                self.stats["errors"] += 1
+                return web.Response(status=self.error_status, text="Injected error")
+            return await handler(request)
+        finally:
+            self._active -= 1
+
+    # OAuth realm
+
+    async def _auth(self, request: web.Request) -> web.Response:
+        for param in ("client_id", "redirect_uri", "code_challenge"):
+            if param not in request.query:
+                return web.Response(status=400, text=f"Missing {param}")
+        session_code = secrets.token_urlsafe(16)
+        action = (
+            f"{self.base_url}{REALM}/login-actions/authenticate?session_code={session_code}"
+            f"&amp;execution={uuid.uuid4()}&amp;client_id=hubspace_android&amp;tab_id={secrets.token_urlsafe(8)}&amp;"
+        )
+        return web.Response(
+            text=f'<html><body><form id="kc-form-login" action="{action}" method="post"></form></body></html>',
+            content_type="text/html",
+        )
+
+    async def _login_action(self, request: web.Request) -> web.Response:
+        form = await request.post()
+        if form.get("username") != self.username or form.get("password") != self.password:
+            return web.Response(status=401, text="Invalid username or password.")
+        code = secrets.token_urlsafe(24)
+        self._codes.add(code)
+        location = f"hubspace-app://loginredirect?state={uuid.uuid4()}&session_state={uuid.uuid4()}&code={code}"
+        return web.Response(status=302, headers={"Location": location})
+
+    def _issue_tokens(self) -> web.Response:
+        access_token = secrets.token_urlsafe(32)
+        refresh_token = secrets.token_urlsafe(32)
+        self._access_tokens[access_token] = time.time() + self.token_lifetime
+        self._refresh_tokens.add(refresh_token)
+        return web.json_response({
+            "access_token": access_token,
+            "expires_in": self.token_lifetime,
+            "refresh_token": refresh_token,
+            "token_type": "Bearer",
+        })
+
+    async def _token(self, request: web.Request) -> web.Response:
+        form = await request.post()
+        grant_type = form.get("grant_type")
+        if grant_type == "authorization_code" and form.get("code") in self._codes:
+            self._codes.discard(form.get("code"))
+            return self._issue_tokens()
+        if grant_type == "refresh_token" and form.get("refresh_token") in self._refresh_tokens:
+            # Refresh tokens rotate
+            self._refresh_tokens.discard(form.get("refresh_token"))
+            return self._issue_tokens()
+        return web.json_response({"error": "invalid_grant"}, status=400)
+
+    # API
+
+    def _authorized(self, request: web.Request) -> bool:
+        scheme, _, token = request.headers.get("Authorization", "").partition(" ")
+        expires = self._access_tokens.get(token)
+        return scheme == "Bearer" and expires is not None and expires > time.time()
+
+    async def _users_me(self, request: web.Request) -> web.Response:
+        if not self._authorized(request):
+            return web.Response(status=401)
+        return web.json_response({
+            "userId": str(uuid.UUID(int=0)),
+            "accountAccess": [
+                {"account": {"accountId": account_id}, "name": f"Account {index + 1}"}
+                for index, account_id in enumerate(self.accounts)
+            ],
+        })
+
+    async def _metadevices(self, request: web.Request) -> web.Response:
+        if not self._authorized(request):
+            return web.Response(status=401)
+        doc = self.accounts.get(request.match_info["account_id"])
+        if doc is None:
+            return web.Response(status=404)
+        return web.json_response(doc)
+
+    def _device(self, request: web.Request) -> Optional[dict]:
+        return self._devices.get((request.match_info["account_id"], request.match_info["device_id"]))
+
+    async def _get_state(self, request: web.Request) -> web.Response:
+        if not self._authorized(request):
+            return web.Response(status=401)
+        metadevice = self._device(request)
+        if metadevice is None:
+            return web.Response(status=404)
+        return web.json_response(metadevice["state"])
+
+    async def _put_state(self, request: web.Request) -> web.Response:
+        if not self._authorized(request):
+            return web.Response(status=401)
+        metadevice = self._device(request)
+        if metadevice is None:
+            return web.Response(status=404)
+        body = await request.json()
+        values = index_state_values(metadevice["state"].get("values"))
+        for state_value in body.get("values", []):
+            key = (state_value.get("functionClass"), state_value.get("functionInstance"))
+            values[key] = dict(values.get(key, {}), **state_value)
+        metadevice["state"]["values"] = list(values.values())
+        return web.json_response(metadevice["state"])
+
+    def build_app(self) -> web.Application:
+        """Return the aiohttp application serving the fake endpoints"""
+        app = web.Application(middlewares=[self._middleware])
+        app.router.add_get(f"{REALM}/protocol/openid-connect/auth", self._auth)
+        app.router.add_post(f"{REALM}/login-actions/authenticate", self._login_action)
+        app.router.add_post(f"{REALM}/protocol/openid-connect/token", self._token)
+        app.router.add_get("/v1/users/me", self._users_me)
+        app.router.add_get("/v1/accounts/{account_id}/metadevices", self._metadevices)
+        app.router.add_get("/v1/accounts/{account_id}/metadevices/{device_id}/state", self._get_state)
+        app.router.add_put("/v1/accounts/{account_id}/metadevices/{device_id}/state", self._put_state)
+        return app
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        """Start serving and return the base URL; port 0 picks a free port"""
+        self._runner = web.AppRunner(self.build_app())
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        bound_port = site._server.sockets[0].getsockname()[1]  # pylint: disable=protected-access
+        self.base_url = f"http://{host}:{bound_port}"
+        _LOGGER.info("Fake Hubspace server listening on %s", self.base_url)
+        return self.base_url
+
+    async def stop(self) -> None:
+        """Stop serving"""
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def __aenter__(self) -> "FakeHubspaceServer":
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc, traceback) -> None:
+        await self.stop()
@@ -0,0 +1,383 @@
+"""Generate synthetic metadevices documents for testing and benchmarking
+
+generate_fleet builds small fleets from built-in device shapes. FleetModel learns device
+models, model mix, hierarchy and state from survey docs and generates statistically
+similar accounts of any size, streaming them to disk.
+"""
+
+from collections import defaultdict
+import copy
+import io
+import json
+import logging
+import random
+from typing import IO, Dict, Iterable, Iterator, List, Optional, Tuple
+import uuid
+from zipfile import ZIP_DEFLATED, ZipFile
+
+from hubspaceng.recording import REDACTED, SENSITIVE_FUNCTION_CLASSES
+
+_LOGGER = logging.getLogger(__name__)
+
+
+def _function(rng: random.Random, function_class: str, function_type: str, values: list, instance: Optional[str] = None) -> dict:
+    function = {
+        "id": str(uuid.UUID(int=rng.getrandbits(128))),
+        "functionClass": function_class,
+        "type": function_type,
+        "values": values,
+    }
+    if instance is not None:
+        function["functionInstance"] = instance
+    return function
+
+
+def _categories(*names: str) -> list:
+    return [{"name": name, "deviceValues": [{"type": "attribute", "value": name}]} for name in names]
+
+
+def _range(minimum: int, maximum: int, step: int) -> list:
+    return [{"name": "value", "range": {"min": minimum, "max": maximum, "step": step}}]
+
+
+def _state_value(function_class: str, value, update_time: int, instance: Optional[str] = None) -> dict:
+    state_value = {"functionClass": function_class, "value": value, "lastUpdateTime": update_time}
+    if instance is not None:
+        state_value["functionInstance"] = instance
+    return state_value
+
+
+def _light(rng: random.Random, update_time: int) -> tuple:
+    functions = [
+        _function(rng, "power", "category", _categories("on", "off"), "light-power"),
+        _function(rng, "brightness", "numeric", _range(1, 100, 1)),
+        _function(rng, "color-temperature", "category", _categories("2700K", "3000K", "4000K", "5000K")),
+    ]
+    state = [
+        _state_value("power", rng.choice(["on", "off"]), update_time, "light-power"),
+        _state_value("brightness", rng.randint(1, 100), update_time),
+        _state_value("color-temperature", rng.choice(["2700K", "3000K", "4000K", "5000K"]), update_time),
+    ]
+    return "light", functions, state
+
+
+def _rgb_light(rng: random.Random, update_time: int) -> tuple:
+    functions = [
+        _function(rng, "power", "category", _categories("on", "off"), "light-power"),
+        _function(rng, "brightness", "numeric", _range(1, 100, 1)),
+        _function(rng, "color-mode", "category", _categories("color", "white")),
+        _function(rng, "color-rgb", "object", []),
+    ]
+    color = {"r": rng.randint(0, 255), "g": rng.randint(0, 255), "b": rng.randint(0, 255)}
+    state = [
+        _state_value("power", rng.choice(["on", "off"]), update_time, "light-power"),
+        _state_value("brightness", rng.randint(1, 100), update_time),
+        _state_value("color-mode", rng.choice(["color", "white"]), update_time),
+        _state_value("color-rgb", {"color-rgb": color}, update_time),
+    ]
+    return "light", functions, state
+
+
+def _fan(rng: random.Random, update_time: int) -> tuple:
+    speeds = ("fan-speed-000", "fan-speed-025", "fan-speed-050", "fan-speed-075", "fan-speed-100")
+    functions = [
+        _function(rng, "power", "category", _categories("on", "off"), "fan-power"),
+        _function(rng, "fan-speed", "category", _categories(*speeds), "fan-speed"),
+        _function(rng, "toggle", "category", _categories("enabled", "disabled"), "comfort-breeze"),
+    ]
+    state = [
+        _state_value("power", rng.choice(["on", "off"]), update_time, "fan-power"),
+        _state_value("fan-speed", rng.choice(speeds), update_time, "fan-speed"),
+        _state_value("toggle", rng.choice(["enabled", "disabled"]), update_time, "comfort-breeze"),
+    ]
+    return "fan", functions, state
+
+
+def _plug(rng: random.Random, update_time: int) -> tuple:
+    functions = [
+        _function(rng, "power", "category", _categories("on", "off")),
+        _function(rng, "timer", "numeric", _range(0, 86400, 60)),
+    ]
+    state = [
+        _state_value("power", rng.choice(["on", "off"]), update_time),
+        _state_value("timer", 0, update_time),
+    ]
+    return "power-outlet", functions, state
+
+
+def _lock(rng: random.Random, update_time: int) -> tuple:
+    functions = [
+        _function(rng, "lock-control", "category", _categories("locked", "unlocked", "locking", "unlocking")),
+        _function(rng, "battery-level", "numeric", _range(0, 100, 1)),
+    ]
+    state = [
+        _state_value("lock-control", rng.choice(["locked", "unlocked"]), update_time),
+        _state_value("battery-level", rng.randint(0, 100), update_time),
+    ]
+    return "door-lock", functions, state
+
+
+DEVICE_BUILDERS = {
+    "light": _light,
+    "rgb-light": _rgb_light,
+    "fan": _fan,
+    "plug": _plug,
+    "lock": _lock,
+}
+
+
+def metadevice(device_id: str, type_id: str, name: str, device_class: str, functions: list, state: list, children: list) -> dict:
+    """Build a metadevice in the shape the metadevices endpoint returns"""
+    return {
+        "id": device_id,
+        "typeId": type_id,
+        "friendlyName": name,
+        "children": children,
+        "description": {"device": {"deviceClass": device_class}, "functions": functions},
+        "state": {"metadeviceId": device_id, "values": state},
+    }
+
+
+def generate_fleet(devices: int = 10, rooms: int = 3, seed: int = 0, update_time: int = 1700000000000) -> list:
+    """Generate a metadevices document for one home with `devices` devices spread over `rooms` rooms
+
+    Device types are drawn evenly from DEVICE_BUILDERS; the same seed always gives the same fleet.
+    """
+    rng = random.Random(seed)
+
+    def new_id() -> str:
+        return str(uuid.UUID(int=rng.getrandbits(128)))
+
+    home_id = new_id()
+    room_ids = [new_id() for _ in range(max(1, rooms))]
+    room_children = {room_id: [] for room_id in room_ids}
+    docs = []
+    for index in range(devices):
+        kind = rng.choice(sorted(DEVICE_BUILDERS))
+        device_class, functions, state = DEVICE_BUILDERS[kind](rng, update_time)
+        device_id = new_id()
+        docs.append(metadevice(
+            device_id, "metadevice.device", f"{kind.title()} {index + 1}", device_class, functions, state, []
+        ))
+        room_children[rng.choice(room_ids)].append(device_id)
+
+    places = [metadevice(home_id, "metadevice.home", "Home", "home", [], [], room_ids)]
+    places.extend(
+        metadevice(room_id, "metadevice.room", f"Room {index + 1}", "room", [], [], room_children[room_id])
+        for index, room_id in enumerate(room_ids)
+    )
+    return places + docs
+
+
+def _model_key(metadevice: dict) -> Tuple:
+    """Identify a device model by its class and the shape of its functions"""
+    description = metadevice.get("description") or {}
+    functions = tuple(sorted(
+        (function.get("functionClass") or "", function.get("functionInstance") or "", function.get("type") or "")
+        for function in description.get("functions", [])
+    ))
+    return ((description.get("device") or {}).get("deviceClass"), functions)
+
+
+def _sample_from_definition(rng: random.Random, function: dict):
+    """Pick a value allowed by a function definition, for functions never seen with a state"""
+    values = function.get("values") or []
+    if function.get("type") == "category" and values:
+        return rng.choice(values).get("name")
+    if function.get("type") == "numeric" and values and "range" in values[0]:
+        value_range = values[0]["range"]
+        steps = int((value_range["max"] - value_range["min"]) // (value_range.get("step") or 1))
+        return value_range["min"] + rng.randint(0, max(steps, 0)) * (value_range.get("step") or 1)
+    return None
+
+
+class DeviceModel:
+    """A device model seen in survey docs: its description, any child models, and observed states"""
+
+    def __init__(self, metadevice: dict, children: List["DeviceModel"]) -> None:
+        self.description = metadevice["description"]
+        device = self.description.get("device") or {}
+        self.device_class = device.get("deviceClass")
+        # Friendly names are set by users, so name devices after the model instead
+        self.name = device.get("defaultName") or device.get("model") or self.device_class
+        self.children = children
+        self.count = 0
+        # Observed values per (functionClass, functionInstance)
+        self.values = defaultdict(list)  # type: Dict[Tuple, list]
+
+    def observe(self, metadevice: dict) -> None:
+        """Record another device of this model and its state"""
+        self.count += 1
+        for state_value in (metadevice.get("state") or {}).get("values", []):
+            value = state_value.get("value")
+            if state_value.get("functionClass") in SENSITIVE_FUNCTION_CLASSES:
+                value = REDACTED
+            self.values[(state_value.get("functionClass"), state_value.get("functionInstance"))].append(value)
+
+    def state(self, rng: random.Random, update_time: int) -> list:
+        """Sample a state for a new device of this model"""
+        state = []
+        for function in self.description.get("functions", []):
+            key = (function.get("functionClass"), function.get("functionInstance"))
+            observed = self.values.get(key)
+            value = copy.deepcopy(rng.choice(observed)) if observed else _sample_from_definition(rng, function)
+            if value is not None:
+                state.append(_state_value(key[0], value, update_time - rng.randint(0, 86400000), key[1]))
+        return state
+
+    def build(self, rng: random.Random, new_id, index: int, update_time: int) -> Tuple[str, List[dict]]:
+        """Build a new device of this model; returns its id and its metadevices, children first"""
+        docs = []
+        child_ids = []
+        for child in self.children:
+            child_id, child_docs = child.build(rng, new_id, index, update_time)
+            child_ids.append(child_id)
+            docs.extend(child_docs)
+        device_id = new_id()
+        device = metadevice(
+            device_id, "metadevice.device", f"{self.name} {index}", self.device_class, [],
+            self.state(rng, update_time), child_ids
+        )
+        # Keep the model, manufacturer and other details along with the functions
+        device["description"] = self.description
+        docs.append(device)
+        return device_id, docs
+
+
+class FleetModel:
+    """Device models, model mix and home/room layout learned from survey docs"""
+
+    def __init__(self) -> None:
+        self.models = {}  # type: Dict[Tuple, DeviceModel]
+        self.rooms_per_home = []  # type: List[int]
+        self.devices_per_room = []  # type: List[int]
+
+    @classmethod
+    def from_docs(cls, docs: Iterable[list]) -> "FleetModel":
+        """Learn from metadevices documents, one per account"""
+        fleet_model = cls()
+        for doc in docs:
+            fleet_model.observe(doc)
+        if not fleet_model.models:
+            raise ValueError("No supported devices found in the survey docs")
+        return fleet_model
+
+    @classmethod
+    def from_survey(cls, *paths: str) -> "FleetModel":
+        """Learn from the *_metadevices.json docs in zips written by tools/survey.py"""
+        docs = []
+        for path in paths:
+            with ZipFile(path) as survey_zip:
+                for name in survey_zip.namelist():
+                    if name.endswith("_metadevices.json"):
+                        docs.append(json.loads(survey_zip.read(name)))
+        return cls.from_docs(docs)
+
+    @classmethod
+    def builtin(cls) -> "FleetModel":
+        """A model built from the shapes generate_fleet uses, for when no survey is available"""
+        return cls.from_docs([generate_fleet(devices=len(DEVICE_BUILDERS) * 20, seed=0)])
+
+    def observe(self, doc: list) -> None:
+        """Learn from one account's metadevices document"""
+        by_id = {metadevice["id"]: metadevice for metadevice in doc}
+        child_ids = {
+            child_id for metadevice in doc if metadevice.get("typeId") == "metadevice.device"
+            for child_id in metadevice.get("children", [])
+        }
+
+        def model_for(metadevice: dict) -> DeviceModel:
+            children = [model_for(by_id[i]) for i in metadevice.get("children", []) if i in by_id]
+            key = (_model_key(metadevice), tuple(id(child) for child in children))
+            model = self.models.get(key)
+            if model is None:
+                model = self.models[key] = DeviceModel(metadevice, children)
+            model.observe(metadevice)
+            return model
+
+        for home in (metadevice for metadevice in doc if metadevice.get("typeId") == "metadevice.home"):
+            self.rooms_per_home.append(len(home.get("children", [])))
+        for room in (metadevice for metadevice in doc if metadevice.get("typeId") == "metadevice.room"):
+            self.devices_per_room.append(len([i for i in room.get("children", []) if i in by_id]))
+        for metadevice in doc:
+            if metadevice.get("typeId") == "metadevice.device" and metadevice["id"] not in child_ids:
+                model_for(metadevice)
+
+    def _top_level_models(self) -> Tuple[list, list]:
+        # Children are only generated as part of their parent
+        children = {id(child) for model in self.models.values() for child in model.children}
+        models = [model for model in self.models.values() if id(model) not in children]
+        return models, [model.count for model in models]
+
+    def generate(self, devices: int, seed: int = 0, update_time: int = 1700000000000) -> Iterator[dict]:
+        """Yield metadevices for one account with at least `devices` devices, counting combo children
+
+        Devices are yielded as they are generated; rooms and homes, which only need the ids
+        of their children, follow at the end, so memory use stays flat for large fleets.
+        """
+        rng = random.Random(seed)
+
+        def new_id() -> str:
+            return str(uuid.UUID(int=rng.getrandbits(128)))
+
+        models, weights = self._top_level_models()
+        rooms_per_home = [count for count in self.rooms_per_home if count > 0] or [1]
+        devices_per_room = [count for count in self.devices_per_room if count > 0] or [1]
+        homes = []  # type: List[Tuple[str, List[str]]]
+        rooms = []  # type: List[Tuple[str, List[str]]]
+        home_capacity = room_capacity = 0
+        generated = 0
+        while generated < devices:
+            if room_capacity == 0:
+                if home_capacity == 0:
+                    homes.append((new_id(), []))
+                    home_capacity = rng.choice(rooms_per_home)
+                rooms.append((new_id(), []))
+                homes[-1][1].append(rooms[-1][0])
+                home_capacity -= 1
+                room_capacity = rng.choice(devices_per_room)
+            device_id, docs = rng.choices(models, weights)[0].build(rng, new_id, generated + 1, update_time)
+            rooms[-1][1].append(device_id)
+            room_capacity -= 1
+            generated += len(docs)
+            yield from docs
+
+        for index, (room_id, children) in enumerate(rooms):
+            yield metadevice(room_id, "metadevice.room", f"Room {index + 1}", "room", [], [], children)
+        for index, (home_id, children) in enumerate(homes):
+            yield metadevice(home_id, "metadevice.home", f"Home {index + 1}", "home", [], [], children)
+
+
+def write_json_array(items: Iterable[dict], out: IO[str]) -> int:
+    """Stream items to a file as a JSON array; returns how many were written"""
+    count = 0
+    out.write("[")
+    for item in items:
+        if count:
+            out.write(",\n")
+        out.write(json.dumps(item, separators=(",", ":")))
+        count += 1
+    out.write("]\n")
+    return count
+
+
+def write_fleet_zip(path: str, fleet_model: FleetModel, devices: int, accounts: int = 1, seed: int = 0) -> None:
+    """Write generated accounts to a zip in the tools/survey.py layout, one doc per account
+
+    The zip can be read back by FleetModel.from_survey and FakeHubspaceServer.from_survey.
+    """
+    rng = random.Random(seed)
+    with ZipFile(path, "w", compression=ZIP_DEFLATED) as fleet_zip:
+        for index in range(accounts):
+            account_id = str(uuid.UUID(int=rng.getrandbits(128)))
+            with fleet_zip.open(f"{account_id}_metadevices.json", "w") as raw_file:
+                with io.TextIOWrapper(raw_file, encoding="utf-8") as doc_file:
+                    write_json_array(fleet_model.generate(devices, seed=seed + index), doc_file)
+
+
+def fleet(surveys: List[str], devices: int = 1000, accounts: int = 1, seed: int = 0, out_path: str = None) -> None:
+    """Generate accounts like those in the survey zips, or from built-in shapes if none are given"""
+    fleet_model = FleetModel.from_survey(*surveys) if surveys else FleetModel.builtin()
+    _LOGGER.info("Learned %d device models", len(fleet_model.models))
+    write_fleet_zip(out_path, fleet_model, devices, accounts, seed)
+    _LOGGER.info("Wrote %d account(s) of %d devices to %s", accounts, devices, out_path)
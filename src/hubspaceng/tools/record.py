@@ -0,0 +1,17 @@
+"""Record redacted Hubspace traffic for offline replay"""
+
+import logging
+
+from hubspaceng.api import login
+from hubspaceng.recording import TrafficRecorder
+
+_LOGGER = logging.getLogger(__name__)
+
+async def record(username: str = None, password: str = None, out_path:str = None):
+    """Log in, load every device and refresh each one, recording the traffic to a JSONL file"""
+
+    _LOGGER.info("Recording traffic to %s...", out_path)
+    async with await login(username, password, transport=TrafficRecorder(out_path)) as hubspace_api:
+        for device in hubspace_api.devices.values():
+            await device.refresh()
+    _LOGGER.info("Recorded traffic for %s devices", len(hubspace_api.devices))
@@ -1,9 +1,39 @@
 """Utility/convenience functions for the Hubspace API"""
 import calendar
 import datetime
+import os
+import tempfile
 
 def get_utc_time() -> int:
     """Get current UTC time"""
     date = datetime.datetime.utcnow()
     utc_time = calendar.timegm(date.utctimetuple()) * 1000
     return utc_time
+
+def index_state_values(state_values: list) -> dict:
+    """Index the values of a metadevice state document by (functionClass, functionInstance)"""
+    indexed = {}
+    for state_value in state_values or []:
+        key = (state_value.get('functionClass'), state_value.get('functionInstance'))
+        indexed[key] = state_value
+    return indexed
+
+def atomic_write(path: str, data: bytes) -> None:
+    """Write a file readable only by the current user, replacing it in one step so readers
+    never see a partial write"""
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    # mkstemp creates the file with 0600 permissions
+    handle, temp_path = tempfile.mkstemp(dir=directory, prefix=".hubspaceng-", suffix=".tmp")
+    try:
+        with os.fdopen(handle, "wb") as temp_file:
+            temp_file.write(data)
+            temp_file.flush()
+            os.fsync(temp_file.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.unlink(temp_path)
+        except OSError:
+            pass
+        raise
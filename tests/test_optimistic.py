@@ -0,0 +1,79 @@
+"""Tests for optimistic state changes"""
+import asyncio
+
+from hubspaceng.deadline import Timeouts
+from hubspaceng.models.functions.category import CategoryFunction
+
+
+class FakeEvents:
+    def __init__(self):
+        self.changes = []
+
+    async def publish(self, events):
+        self.changes.extend((event.old_value, event.new_value) for event in events)
+
+
+class FakeAPI:
+    optimistic_updates = True
+
+    def __init__(self):
+        self.events = FakeEvents()
+        self.timeouts = Timeouts()
+
+
+class FakeDevice:
+    """Echoes each PUT once the test releases it"""
+    id = "device1"
+    active_batch = None
+
+    def __init__(self):
+        self.api = FakeAPI()
+        self.releases = []
+
+    async def _put_state_values(self, state_values, priority=None):
+        release = asyncio.Event()
+        self.releases.append(release)
+        await release.wait()
+        return {"values": state_values}
+
+
+def make_power(device):
+    power = CategoryFunction("Power", device, {
+        "id": "power1",
+        "functionClass": "power",
+        "type": "category",
+        "values": [{"name": name, "deviceValues": [{"value": name}]} for name in ("on", "off")],
+    })
+    power.apply_state("on")
+    return power
+
+
+def test_superseded_writes_publish_only_the_requested_changes():
+    async def run():
+        device = FakeDevice()
+        power = make_power(device)
+        for value in ("off", "on", "off"):
+            await power.set_state(value)
+        while len(device.releases) < 3:
+            await asyncio.sleep(0)
+        # Confirm the older writes while the newest is still in flight
+        for release in device.releases[:2]:
+            release.set()
+            await asyncio.sleep(0.01)
+        assert power.get_state() == "off"
+        assert power.pending
+        device.releases[2].set()
+        await asyncio.sleep(0.01)
+        return device, power
+
+    device, power = asyncio.run(run())
+    assert device.api.events.changes == [("on", "off"), ("off", "on"), ("on", "off")]
+    assert power.get_state() == "off"
+    assert not power.pending
+
+
+def test_rollback_remover_can_be_called_twice():
+    power = make_power(FakeDevice())
+    remove = power.on_rollback(lambda function, attempted, restored: None)
+    remove()
+    remove()
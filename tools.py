@@ -5,6 +5,8 @@ import asyncio
 import logging
 import json
 
+from hubspaceng.tools.fleet import fleet
+from hubspaceng.tools.record import record
 from hubspaceng.tools.report import report
 from hubspaceng.tools.survey import survey
 from hubspaceng.tools.test_connect import test_connect
@@ -30,9 +32,13 @@ def _read_creds():
 
 def _parseargs():
     parser = argparse.ArgumentParser(description='Get debug data from your Hubspace account.')
-    parser.add_argument('action', choices=['survey', 'connection_log', 'report'], help="the type of debugging to do")
+    parser.add_argument('action', choices=['survey', 'connection_log', 'report', 'record', 'fleet'], help="the type of debugging to do")
     parser.add_argument('-a', '--anonymize', action='store_true', help="Anonymize survey results; does not apply to other actions")
     parser.add_argument('-d', '--detailed', action='store_true', help="When possible, create a more detailed product (state, etc.)")
+    parser.add_argument('-i', '--input', action='append', default=[], help="Survey zip to model a fleet on; may be repeated; fleet only")
+    parser.add_argument('-n', '--devices', type=int, default=1000, help="Devices per generated account; fleet only")
+    parser.add_argument('--accounts', type=int, default=1, help="Accounts to generate; fleet only")
+    parser.add_argument('--seed', type=int, default=0, help="Seed for repeatable fleets; fleet only")
     parser.add_argument('filename', help="file to output to")
 
     args = parser.parse_args()
@@ -42,6 +48,11 @@ def _parseargs():
 async def main():
     """Run the selected tool"""
     args = _parseargs()
+    if args.action == 'fleet':
+        # Generated from survey files, so no account is needed
+        _LOGGER.info("Generating fleet...")
+        fleet(args.input, args.devices, args.accounts, args.seed, args.filename)
+        return
     creds = _read_creds()
 
     if args.action == 'survey':
@@ -53,5 +64,8 @@ async def main():
     elif args.action == 'report':
         _LOGGER.info("Creating device report...")
         await report(creds['username'], creds['password'], args.detailed, args.filename)
+    elif args.action == 'record':
+        _LOGGER.info("Recording traffic...")
+        await record(creds['username'], creds['password'], args.filename)
 
 asyncio.run(main())